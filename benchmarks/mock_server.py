@@ -0,0 +1,171 @@
+import asyncio
+import random
+import time
+import uuid
+from collections import defaultdict, deque
+
+from aiohttp import web
+
+
+class MockUrlScan:
+    RATE_LIMIT_WINDOW = 60
+
+    def __init__(self, scan_delay=2.0, error_rate=0.0, throttle_rate=0.0, rate_limits=None,
+                 screenshot_size=50 * 1024, dom_size=250 * 1024, search_total=1000, seed=None):
+        self.scan_delay = scan_delay
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limits = rate_limits or {"scan": 1000, "result": 5000, "search": 1000}
+        self.screenshot = b"\x89PNG" + b"\x00" * max(screenshot_size - 4, 0)
+        self.dom = b"<html>" + b"a" * max(dom_size - 6, 0)
+        self.search_total = search_total
+        self.random = random.Random(seed)
+        self.base_url = None
+        self.submissions = {}
+        self.requests = defaultdict(deque)
+        self.counts = defaultdict(int)
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/api/v1/scan/", self.scan)
+        app.router.add_get("/api/v1/result/{scan_uuid}", self.result)
+        app.router.add_get("/api/v1/result/{scan_uuid}/", self.result)
+        app.router.add_get("/api/v1/search/", self.search)
+        app.router.add_get("/screenshots/{name}", self.screenshot_file)
+        app.router.add_get("/dom/{scan_uuid}/", self.dom_file)
+        return app
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]   # pylint: disable=W0212
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def rate_limit(self, action):
+        now = time.monotonic()
+        window = self.requests[action]
+        while window and window[0] <= now - self.RATE_LIMIT_WINDOW:
+            window.popleft()
+        limit = self.rate_limits[action]
+        reset_after = self.RATE_LIMIT_WINDOW - (now - window[0]) if window else self.RATE_LIMIT_WINDOW
+        exhausted = len(window) >= limit
+        if not exhausted:
+            window.append(now)
+        headers = {
+            "X-Rate-Limit-Scope": "team",
+            "X-Rate-Limit-Action": action,
+            "X-Rate-Limit-Window": "minute",
+            "X-Rate-Limit-Limit": str(limit),
+            "X-Rate-Limit-Remaining": str(max(limit - len(window), 0)),
+            "X-Rate-Limit-Reset-After": f"{reset_after:.3f}"
+        }
+        return exhausted, headers
+
+    @staticmethod
+    def error_response(status, message, headers=None):
+        body = {"message": message, "description": message, "status": status}
+        return web.json_response(body, status=status, headers=headers)
+
+    def injected_failure(self, headers):
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            return self.error_response(429, "Too Many Requests", {**headers, "Retry-After": "1"})
+        if roll < self.throttle_rate + self.error_rate:
+            return self.error_response(503, "Service Unavailable")
+        return None
+
+    def guarded(self, action):
+        self.counts[action] += 1
+        exhausted, headers = self.rate_limit(action)
+        if exhausted:
+            self.counts[f"{action}_throttled"] += 1
+            retry_after = {**headers, "Retry-After": headers["X-Rate-Limit-Reset-After"]}
+            return headers, self.error_response(429, "Rate limit exceeded", retry_after)
+        failure = self.injected_failure(headers)
+        if failure is not None:
+            self.counts[f"{action}_failed"] += 1
+        return headers, failure
+
+    async def scan(self, request):
+        headers, failure = self.guarded("scan")
+        if failure is not None:
+            return failure
+        body = await request.json()
+        scan_uuid = str(uuid.uuid4())
+        self.submissions[scan_uuid] = (body["url"], time.monotonic())
+        return web.json_response({
+            "message": "Submission successful",
+            "uuid": scan_uuid,
+            "result": f"{self.base_url}/result/{scan_uuid}/",
+            "api": f"{self.base_url}/api/v1/result/{scan_uuid}/",
+            "visibility": "public" if body.get("public") else "private",
+            "url": body["url"]
+        }, headers=headers)
+
+    def result_document(self, scan_uuid, url):
+        return {
+            "task": {
+                "uuid": scan_uuid,
+                "url": url,
+                "time": "2021-01-01T00:00:00.000Z",
+                "reportURL": f"{self.base_url}/result/{scan_uuid}/",
+                "screenshotURL": f"{self.base_url}/screenshots/{scan_uuid}.png",
+                "domURL": f"{self.base_url}/dom/{scan_uuid}/"
+            },
+            "page": {"url": url, "domain": url.split("/")[2] if "//" in url else url},
+            # Real results carry every request made by the page, which is what makes them large
+            "data": {"requests": [{"request": {"url": f"{url}/asset/{i}", "method": "GET"}} for i in range(200)]}
+        }
+
+    async def result(self, request):
+        scan_uuid = request.match_info["scan_uuid"]
+        headers, failure = self.guarded("result")
+        if failure is not None:
+            return failure
+        if scan_uuid not in self.submissions:
+            # Unknown UUIDs are treated as scans made before the server started, eg by --batch-retrieve
+            self.submissions[scan_uuid] = ("https://www.example.com", time.monotonic() - self.scan_delay)
+        url, submitted_at = self.submissions[scan_uuid]
+        if time.monotonic() - submitted_at < self.scan_delay:
+            return self.error_response(404, "Not Found", headers)
+        return web.json_response(self.result_document(scan_uuid, url), headers=headers)
+
+    async def search(self, request):
+        headers, failure = self.guarded("search")
+        if failure is not None:
+            return failure
+        size = int(request.query.get("size", 100))
+        start = int(request.query["search_after"].split(",")[0]) + 1 if "search_after" in request.query else 0
+        end = min(start + size, self.search_total)
+        results = [{
+            "_id": str(i),
+            "sort": [i, str(i)],
+            "task": {"uuid": str(uuid.UUID(int=i)), "url": f"https://www.example{i}.com"}
+        } for i in range(start, end)]
+        body = {"results": results, "total": self.search_total, "has_more": end < self.search_total}
+        return web.json_response(body, headers=headers)
+
+    async def screenshot_file(self, _):
+        self.counts["screenshot"] += 1
+        return web.Response(body=self.screenshot, content_type="image/png")
+
+    async def dom_file(self, _):
+        self.counts["dom"] += 1
+        return web.Response(body=self.dom, content_type="text/plain")
+
+
+async def serve(host="127.0.0.1", port=8080, **kwargs):
+    server = MockUrlScan(**kwargs)
+    print(f"Mock urlscan API listening on {await server.start(host, port)}")
+    while True:
+        await asyncio.sleep(3600)
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
@@ -0,0 +1,214 @@
+import argparse
+import asyncio
+import io
+import json
+import logging
+import multiprocessing
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from benchmarks.mock_server import MockUrlScan
+from src.urlscanio import urlscan, utils
+
+
+class TimedUrlScan(urlscan.UrlScan):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self.started_at = {}
+
+    # investigate runs through both of these too, so both batch modes are timed the same way
+    async def submit_investigation(self, url, *args, **kwargs):
+        self.started_at[url] = time.monotonic()
+        return await super().submit_investigation(url, *args, **kwargs)
+
+    async def download_investigation(self, investigation, *args, **kwargs):
+        investigation = await super().download_investigation(investigation, *args, **kwargs)
+        self.latencies.append(time.monotonic() - self.started_at.pop(investigation["url"]))
+        return investigation
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def serve_mock(options, ready):
+    async def serve():
+        server = MockUrlScan(scan_delay=options.scan_delay, error_rate=options.error_rate,
+                             throttle_rate=options.throttle_rate, screenshot_size=options.screenshot_size,
+                             dom_size=options.dom_size, search_total=options.search_results, seed=0,
+                             rate_limits={"scan": options.scan_limit, "result": options.result_limit,
+                                          "search": options.search_limit})
+        ready.put(await server.start())
+        while True:
+            await asyncio.sleep(3600)
+
+    asyncio.run(serve())
+
+
+def create_url_scan(options, base_url, data_dir):
+    # Investigations are logged at the critical level, which would drown out the results
+    url_scan = TimedUrlScan(api_key="benchmark", data_dir=data_dir, log_level=logging.CRITICAL + 1)
+    url_scan.URLSCAN_API_URL = f"{base_url}/api/v1"
+    url_scan.DEFAULT_PAUSE_TIME = options.pause_time
+    url_scan.scan_latency = options.scan_delay
+    return url_scan
+
+
+async def investigate_scenario(options, base_url, data_dir):
+    urls_file = Path(data_dir).joinpath("urls.txt")
+    urls_file.write_text("".join(f"https://www.example{i}.com\n" for i in range(options.urls)))
+    async with create_url_scan(options, base_url, data_dir) as url_scan:
+        started_at = time.monotonic()
+        await url_scan.batch_investigate(str(urls_file), workers=options.workers,
+                                         output_path=Path(data_dir).joinpath("urls.csv"),
+                                         stage_workers=options.stage_workers)
+        return time.monotonic() - started_at, url_scan.latencies, url_scan.metrics.summary()
+
+
+async def retrieve_scenario(options, base_url, data_dir):
+    async with create_url_scan(options, base_url, data_dir) as url_scan:
+        latencies = []
+
+        async def uuids():
+            for _ in range(options.uuids):
+                yield str(uuid.uuid4())
+
+        async def retrieve(scan_uuid):
+            started_at = time.monotonic()
+            await url_scan.fetch_result(scan_uuid)
+            latencies.append(time.monotonic() - started_at)
+
+        started_at = time.monotonic()
+        await url_scan.run_workers(uuids(), retrieve, options.workers)
+        return time.monotonic() - started_at, latencies, url_scan.metrics.summary()
+
+
+async def search_scenario(options, base_url, data_dir):
+    async with create_url_scan(options, base_url, data_dir) as url_scan:
+        latencies = []
+        output = io.StringIO()
+        started_at = time.monotonic()
+        last_result_at = started_at
+        async for result in url_scan.iter_search("domain:example.com", limit=options.search_results):
+            output.write(json.dumps(result) + "\n")
+            latencies.append(time.monotonic() - last_result_at)
+            last_result_at = time.monotonic()
+        return time.monotonic() - started_at, latencies, url_scan.metrics.summary()
+
+
+SCENARIOS = {
+    "investigate": investigate_scenario,
+    "retrieve": retrieve_scenario,
+    "search": search_scenario
+}
+
+
+def run_scenario(name, options, base_url, results):
+    with tempfile.TemporaryDirectory() as data_dir:
+        utils.create_data_dir(data_dir)
+        elapsed, latencies, metrics = asyncio.run(SCENARIOS[name](options, base_url, data_dir))
+    results.put({
+        "scenario": name,
+        "items": len(latencies),
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 3) if elapsed else None,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "metrics": metrics
+    })
+
+
+def in_subprocess(target, *args):
+    # Each scenario and the mock server get their own process, so peak RSS only covers the client under test
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=target, args=(*args, queue), daemon=True)
+    process.start()
+    return process, queue
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["scenario"])
+        if previous and result["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{result['scenario']}: throughput {result['throughput']}/s, "
+                               f"baseline {previous['throughput']}/s")
+        if previous and previous["p99"] and result["p99"] > previous["p99"] * (1 + tolerance):
+            regressions.append(f"{result['scenario']}: p99 {result['p99']:.3f}s, baseline {previous['p99']:.3f}s")
+    return regressions
+
+
+def create_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="benchmarks",
+        description="Run urlscanio against a local mock of the urlscan.io API and report its performance."
+    )
+    parser.add_argument("scenarios", help=f"Scenarios to run, all of them by default: {', '.join(SCENARIOS)}",
+                        nargs="*")
+    parser.add_argument("--urls", help="URLs investigated by the investigate scenario", type=int, default=200)
+    parser.add_argument("--uuids", help="UUIDs retrieved by the retrieve scenario", type=int, default=500)
+    parser.add_argument("--search-results", help="Results paged through by the search scenario",
+                        type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=50)
+    parser.add_argument("--stage-workers", help="SUBMIT,POLL,DOWNLOAD workers of the investigate scenario",
+                        type=utils.parse_stage_workers)
+    parser.add_argument("--scan-delay", help="Seconds before a submitted scan is ready", type=float, default=2)
+    parser.add_argument("--pause-time", help="UrlScan.DEFAULT_PAUSE_TIME used by the client", type=float, default=0.5)
+    parser.add_argument("--error-rate", help="Share of API calls failing with a 503", type=float, default=0)
+    parser.add_argument("--throttle-rate", help="Share of API calls failing with a 429", type=float, default=0)
+    parser.add_argument("--scan-limit", help="Scans allowed per minute", type=int, default=6000)
+    parser.add_argument("--result-limit", help="Result calls allowed per minute", type=int, default=60000)
+    parser.add_argument("--search-limit", help="Search calls allowed per minute", type=int, default=6000)
+    parser.add_argument("--screenshot-size", type=int, default=50 * 1024)
+    parser.add_argument("--dom-size", type=int, default=250 * 1024)
+    parser.add_argument("--save", help="Write the results to this file, to be used as a baseline later")
+    parser.add_argument("--baseline", help="Fail if throughput or p99 latency regressed against this file")
+    parser.add_argument("--tolerance", help="Allowed regression against the baseline", type=float, default=0.2)
+    return parser
+
+
+def main():
+    parser = create_arg_parser()
+    options = parser.parse_args()
+    options.scenarios = options.scenarios or list(SCENARIOS)
+    if not set(options.scenarios) <= set(SCENARIOS):
+        parser.error(f"scenarios must be among {', '.join(SCENARIOS)}")
+    server, ready = in_subprocess(serve_mock, options)
+    base_url = ready.get(timeout=30)
+
+    results = []
+    try:
+        for name in options.scenarios:
+            process, queue = in_subprocess(run_scenario, name, options, base_url)
+            result = queue.get()
+            process.join()
+            results.append(result)
+            print(json.dumps({key: value for key, value in result.items() if key != "metrics"}), flush=True)
+    finally:
+        server.terminate()
+
+    if options.save:
+        Path(options.save).write_text(json.dumps({result["scenario"]: result for result in results}, indent=1))
+    if options.baseline:
+        regressions = compare(results, json.loads(Path(options.baseline).read_text()), options.tolerance)
+        for regression in regressions:
+            print(f"Regression in {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
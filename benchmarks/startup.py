@@ -0,0 +1,83 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).absolute().parents[1]
+ENTRY_POINT = "from src.urlscanio.__main__ import main; main()"
+
+# Runs which never reach the network, where startup is all there is to the run time
+COMMANDS = {
+    "interpreter": ["-c", "pass"],
+    "help": ["-c", ENTRY_POINT, "--help"],
+    "invalid_arguments": ["-c", ENTRY_POINT, "-i", "not-a-url"]
+}
+
+
+def time_command(args, runs):
+    timings = []
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT_DIR, capture_output=True, check=False)
+        timings.append(time.perf_counter() - started_at)
+    return statistics.median(timings)
+
+
+def import_time(module):
+    # -X importtime writes the cumulative import time of every module, in microseconds, to stderr
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT_DIR,
+                            capture_output=True, text=True, check=True).stderr
+    for line in reversed(output.splitlines()):
+        fields = [field.strip() for field in line.split("|")]
+        if fields[-1] == module:
+            return int(fields[1]) / 1e6
+    return None
+
+
+def measure(runs):
+    timings = {name: time_command(args, runs) for name, args in COMMANDS.items()}
+    results = {name: {"median": round(timing, 4), "overhead": round(timing - timings["interpreter"], 4)}
+               for name, timing in timings.items() if name != "interpreter"}
+    results["import"] = {"overhead": round(import_time("src.urlscanio.__main__"), 4)}
+    return results
+
+
+def compare(results, baseline, tolerance):
+    return [f"{name}: {result['overhead']:.3f}s over the interpreter's startup, "
+            f"baseline {baseline[name]['overhead']:.3f}s"
+            for name, result in results.items()
+            if name in baseline and result["overhead"] > baseline[name]["overhead"] * (1 + tolerance)]
+
+
+def create_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="benchmarks.startup",
+        description="Measure how long urlscanio takes to start, on top of the Python interpreter's own startup."
+    )
+    parser.add_argument("--runs", help="Runs of each command, the median is reported", type=int, default=20)
+    parser.add_argument("--save", help="Write the results to this file, to be used as a baseline later")
+    parser.add_argument("--baseline", help="Fail if startup got slower than in this file")
+    parser.add_argument("--tolerance", help="Allowed regression against the baseline", type=float, default=0.5)
+    return parser
+
+
+def main():
+    options = create_arg_parser().parse_args()
+    results = measure(options.runs)
+    print(json.dumps(results, indent=1))
+
+    if options.save:
+        Path(options.save).write_text(json.dumps(results, indent=1))
+    if options.baseline:
+        regressions = compare(results, json.loads(Path(options.baseline).read_text()), options.tolerance)
+        for regression in regressions:
+            print(f"Regression in {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
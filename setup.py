@@ -11,6 +11,13 @@ INSTALL_REQUIRES = [
     "aiofiles"
 ]
 
+EXTRAS_REQUIRE = {
+    "orjson": ["orjson"],
+    "parquet": ["pyarrow"],
+    "uvloop": ["uvloop"],
+    "zstd": ["zstandard"]
+}
+
 TESTS_REQUIRES = [
     "Pillow",
     "pylint",
@@ -45,6 +52,7 @@ setuptools.setup(
     setup_requires=SETUP_REQUIRES,
     tests_require=TESTS_REQUIRES,
     install_requires=INSTALL_REQUIRES,
+    extras_require=EXTRAS_REQUIRE,
     entry_points={
         "console_scripts": [
             "urlscanio = src.urlscanio.__main__:main"
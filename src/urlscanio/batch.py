@@ -0,0 +1,156 @@
+import csv
+from pathlib import Path
+
+from .journal import Journal
+from .retry import RetryPolicy
+
+
+class BatchInvestigation:
+    HEADER = ["url", "report", "screenshot", "dom", "outcome"]
+    REJECTS_HEADER = ["line", "input", "reason"]
+
+    def __init__(self, url_scan, output_path, private=False, resume=False):
+        self.url_scan = url_scan
+        self.logger = url_scan.logger
+        self.output_path = Path(output_path)
+        self.rejects_path = self.output_path.with_name(f"{self.output_path.stem}.rejects.csv")
+        self.private = private
+        self.resume = resume
+        # Input lines waiting for their URL to be investigated, and the results of URLs already investigated,
+        # so that duplicates cost a single scan but still get a row each
+        self.waiting = {}
+        self.finished = {}
+        # Lines rejected by the run being resumed, which already have their rows
+        self.rejected = set()
+        self.output_file = self.rejects_file = self.journal = None
+        self.output = self.rejects = None
+
+    def __enter__(self):
+        if self.resume:
+            self.rejected = self.load_rejects()
+        mode = "a" if self.resume else "w"
+        self.output_file = open(self.output_path, mode, newline="", encoding="utf-8")
+        self.rejects_file = open(self.rejects_path, mode, newline="", encoding="utf-8")
+        self.journal = Journal(self.output_path.with_suffix(".journal"), self.resume)
+        self.output = csv.writer(self.output_file)
+        self.rejects = csv.writer(self.rejects_file)
+        # A resumed run may have lost its output, or predate rejects being recorded, but keeps its journal
+        if self.output_file.tell() == 0:
+            self.output.writerow(self.HEADER)
+            self.output_file.flush()
+        if self.rejects_file.tell() == 0:
+            self.rejects.writerow(self.REJECTS_HEADER)
+            self.rejects_file.flush()
+        return self
+
+    def __exit__(self, *excinfo):
+        self.journal.close()
+        self.rejects_file.close()
+        self.output_file.close()
+
+    def write_rows(self, lines, result):
+        for line in lines:
+            self.output.writerow([line, *result])
+        self.output_file.flush()
+
+    def load_rejects(self):
+        try:
+            with open(self.rejects_path, "r", newline="", encoding="utf-8") as rejects_file:
+                return {int(row[0]) for row in csv.reader(rejects_file) if row and row[0].isdigit()}
+        except OSError:
+            return set()
+
+    def reject(self, line_number, line, reason):
+        if line_number in self.rejected:
+            return
+        self.logger.critical("Skipping line %d, %s is not a valid URL", line_number, line)
+        self.rejects.writerow([line_number, line, reason])
+        self.rejects_file.flush()
+        self.write_rows([line], [None, None, None, "rejected"])
+
+    async def read_urls(self, urls_file):
+        line_number = 0
+        async for line in self.url_scan.read_lines(urls_file):
+            line_number += 1
+            line = line.strip()
+            if not line:
+                continue
+            url = self.url_scan.canonical_url(line)
+            if url is None:
+                self.reject(line_number, line, "invalid URL")
+            elif url in self.finished:
+                self.write_rows([line], self.finished[url])
+            elif url in self.waiting:
+                self.waiting[url].append(line)
+            else:
+                self.waiting[url] = [line]
+                yield url
+
+    def previous_entry(self, url):
+        entry = self.journal.get(url)
+        # A scan which failed to be polled or downloaded may have finished since, so only URLs which never got one
+        # are final. The others are polled again and get a new row, which supersedes the failure.
+        if entry.get("state") == self.journal.DONE or \
+                (entry.get("state") == self.journal.FAILED and not entry.get("scan_uuid")):
+            self.logger.info("Skipping %s, already investigated in a previous run", url)
+            del self.waiting[url]
+            return None
+        return entry
+
+    def failed(self, url, error, scan_uuid):
+        # A URL which keeps failing must not take the rest of the batch down with it
+        self.logger.critical("Investigation of %s failed: %r", url, error)
+        return {"scan_uuid": scan_uuid} if scan_uuid else {}
+
+    def finish(self, url, result):
+        self.finished[url] = self.url_scan.batch_row(url, result)[1:]
+        self.write_rows(self.waiting.pop(url), self.finished[url])
+        state = self.journal.DONE if result.get("report") else self.journal.FAILED
+        self.journal.record(url, state, scan_uuid=result.get("scan_uuid"))
+
+    async def handle(self, url):
+        entry = self.previous_entry(url)
+        if entry is None:
+            return
+        if entry.get("state") == self.journal.DOWNLOADED:
+            result = entry
+        else:
+            try:
+                result = await self.url_scan.investigate(url, self.private, entry.get("scan_uuid"), self.journal)
+            except RetryPolicy.RETRYABLE_ERRORS as error:
+                result = self.failed(url, error, entry.get("scan_uuid"))
+        self.finish(url, result)
+
+    async def submit(self, url):
+        entry = self.previous_entry(url)
+        if entry is None:
+            return None
+        if entry.get("state") == self.journal.DOWNLOADED:
+            return {"url": url, "result": entry}
+        try:
+            return await self.url_scan.submit_investigation(url, self.private, entry.get("scan_uuid"), self.journal)
+        except RetryPolicy.RETRYABLE_ERRORS as error:
+            return {"url": url, "result": self.failed(url, error, entry.get("scan_uuid"))}
+
+    async def poll(self, investigation):
+        try:
+            return await self.url_scan.poll_investigation(investigation, self.journal)
+        except RetryPolicy.RETRYABLE_ERRORS as error:
+            return {**investigation, "result": self.failed(investigation["url"], error, investigation["scan_uuid"])}
+
+    async def download(self, investigation):
+        try:
+            investigation = await self.url_scan.download_investigation(investigation, self.journal)
+        except RetryPolicy.RETRYABLE_ERRORS as error:
+            investigation = {**investigation,
+                             "result": self.failed(investigation["url"], error, investigation["scan_uuid"])}
+        self.finish(investigation["url"], investigation["result"])
+
+    async def run(self, urls_file, workers, stage_workers=None):
+        urls = self.read_urls(urls_file)
+        if stage_workers:
+            submit_workers, poll_workers, download_workers = stage_workers
+            await self.url_scan.run_pipeline(urls, [(self.submit, submit_workers), (self.poll, poll_workers),
+                                                    (self.download, download_workers)])
+        else:
+            await self.url_scan.run_workers(urls, self.handle, workers)
@@ -0,0 +1,99 @@
+import gzip
+import json
+import os
+import time
+from pathlib import Path
+
+import aiofiles
+
+
+class ResultCache:
+    DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE, compress=True):
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self.compress = compress
+        self.size = None
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def path(self, scan_uuid):
+        suffix = ".json.gz" if self.compress else ".json"
+        return self.cache_dir.joinpath(f"{scan_uuid}{suffix}")
+
+    def entries(self):
+        return [entry for entry in self.cache_dir.iterdir() if entry.suffix in (".json", ".gz")]
+
+    async def get(self, scan_uuid):
+        path = self.path(scan_uuid)
+        try:
+            async with aiofiles.open(path, "rb") as cached:
+                content = await cached.read()
+        except FileNotFoundError:
+            return None
+        # Eviction is based on modification time, so touching an entry marks it as recently used
+        os.utime(path)
+        return gzip.decompress(content) if self.compress else content
+
+    async def put(self, scan_uuid, content):
+        path = self.path(scan_uuid)
+        if self.compress:
+            content = gzip.compress(content)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        async with aiofiles.open(tmp_path, "wb") as cached:
+            await cached.write(content)
+        os.replace(tmp_path, path)
+
+        if self.size is None:
+            self.size = sum(entry.stat().st_size for entry in self.entries())
+        else:
+            self.size += len(content)
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        entries = sorted(((entry.stat(), entry) for entry in self.entries()), key=lambda item: item[0].st_mtime)
+        self.size = sum(stat.st_size for stat, _ in entries)
+        for stat, entry in entries:
+            if self.size <= self.max_size:
+                break
+            entry.unlink(missing_ok=True)
+            self.size -= stat.st_size
+
+
+class SubmissionIndex:
+    DEFAULT_RETENTION = 24 * 60 * 60
+
+    def __init__(self, index_path, retention=DEFAULT_RETENTION):
+        self.index_path = Path(index_path)
+        self.retention = retention
+        self.submissions = {}
+        if self.index_path.exists():
+            self.load()
+
+    def load(self):
+        cutoff = time.time() - self.retention
+        with open(self.index_path, "r", encoding="utf-8") as index_file:
+            for line in index_file:
+                try:
+                    url, scan_uuid, submitted_at = json.loads(line)
+                except ValueError:
+                    continue
+                if submitted_at >= cutoff:
+                    self.submissions[url] = (scan_uuid, submitted_at)
+        # Rewrite the index so that expired submissions don't pile up
+        with open(self.index_path, "w", encoding="utf-8") as index_file:
+            for url, (scan_uuid, submitted_at) in self.submissions.items():
+                index_file.write(json.dumps([url, scan_uuid, submitted_at]) + "\n")
+
+    def get(self, url, max_age):
+        scan_uuid, submitted_at = self.submissions.get(url, (None, 0))
+        if scan_uuid and time.time() - submitted_at <= max_age:
+            return scan_uuid
+        return None
+
+    def add(self, url, scan_uuid):
+        submitted_at = time.time()
+        self.submissions[url] = (scan_uuid, submitted_at)
+        with open(self.index_path, "a", encoding="utf-8") as index_file:
+            index_file.write(json.dumps([url, str(scan_uuid), submitted_at]) + "\n")
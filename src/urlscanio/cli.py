@@ -0,0 +1,152 @@
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+from . import service, transport, urlscan, utils
+from .cache import ResultCache, SubmissionIndex
+from .extract import Extractor
+from .keypool import KeyPool
+from .metrics import Metrics
+from .reports import ReportStore
+from .retry import RetryPolicy
+from .store import ArtifactStore
+from .tracing import Tracer
+from .watch import Watcher
+
+
+def start(args, log_level):
+    transport.install_event_loop_policy(args.uvloop)
+
+    server = utils.service_address(args)
+    if server:
+        asyncio.run(execute_remotely(args, server, log_level))
+        return
+
+    api_key = os.environ["URLSCAN_API_KEY"]
+    data_dir = Path(os.getenv("URLSCAN_DATA_DIR", "."))
+
+    utils.create_data_dir(data_dir)
+
+    asyncio.run(execute(args, api_key, data_dir, log_level))
+
+async def execute_remotely(args, server, log_level):
+    async with service.ServiceClient(server, log_level) as client:
+        await run(args, client)
+
+async def execute(args, api_key, data_dir, log_level):
+    result_cache = None
+    if args.cache_size > 0:
+        result_cache = ResultCache(data_dir.joinpath("cache"), max_size=args.cache_size * 1024 * 1024)
+
+    submission_index = SubmissionIndex(data_dir.joinpath("submissions.jsonl"))
+
+    artifact_store = None
+    if args.artifact_store:
+        artifact_store = ArtifactStore(data_dir.joinpath("store"), compression=args.artifact_store)
+
+    key_pool = KeyPool.from_strings(api_key, os.getenv("URLSCAN_PRIVATE_API_KEYS", ""),
+                                    os.getenv("URLSCAN_PUBLIC_API_KEYS", ""))
+    report_store = None
+    if args.report_store:
+        report_store = ReportStore(data_dir.joinpath("reports.sqlite"))
+
+    metrics = Metrics()
+    tracer = Tracer() if args.trace else None
+    retry_policy = RetryPolicy(max_attempts=args.max_attempts, deadline=args.request_deadline)
+
+    session = transport.create_session(
+        limit=args.connections,
+        limit_per_host=args.connections_per_host,
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout
+    )
+
+    try:
+        async with session, urlscan.UrlScan(api_key=api_key, data_dir=data_dir, log_level=log_level,
+                                            result_cache=result_cache, reuse_max_age=args.reuse_max_age,
+                                            submission_index=submission_index, session=session,
+                                            artifact_store=artifact_store, metrics=metrics,
+                                            retry_policy=retry_policy, key_pool=key_pool,
+                                            report_store=report_store,
+                                            force_downloads=args.force, tracer=tracer) as url_scan:
+            if args.serve:
+                await service.ScanService(url_scan, args.workers).serve_forever(args.serve)
+            else:
+                await run(args, url_scan)
+    finally:
+        # A service only stops when interrupted, which is also when its metrics are worth writing
+        if args.metrics_json:
+            metrics.write_json(args.metrics_json)
+        if args.metrics_prometheus:
+            metrics.write_prometheus(args.metrics_prometheus)
+        if args.trace:
+            tracer.write(args.trace, args.trace_format)
+        if artifact_store:
+            artifact_store.close()
+        if report_store:
+            report_store.close()
+
+async def run(args, url_scan):
+    if args.investigate:
+        investigation_result = await url_scan.investigate(args.investigate, args.private)
+        if investigation_result == {}:
+            print("\nInvestigation failed. Please try again later.")
+        else:
+            if investigation_result.keys() >= {"report", "screenshot", "dom"}:
+                print(f"\nScan report URL:\t\t{investigation_result['report']}")
+                print(f"Screenshot download location:\t{investigation_result['screenshot']}")
+                print(f"DOM download location:\t\t{investigation_result['dom']}\n")
+
+    elif args.retrieve:
+        retrieve_result = await url_scan.fetch_result(args.retrieve)
+        print(f"\nScan report URL:\t\t{retrieve_result['report']}")
+        print(f"Screenshot download location:\t{retrieve_result['screenshot']}")
+        print(f"DOM download location:\t\t{retrieve_result['dom']}\n")
+
+    elif args.submit:
+        scan_uuid = await url_scan.submit_scan_request(args.submit, args.private)
+        if scan_uuid == "":
+            print(f"\nFailed to submit scan request for {args.submit}. Please try again later.\n")
+        else:
+            print(f"\nScan UUID:\t\t{scan_uuid}\n")
+
+    elif args.batch_investigate:
+        output_path = await url_scan.batch_investigate(
+            args.batch_investigate, args.private, args.workers, resume=args.resume, stage_workers=args.stage_workers
+        )
+        print(f"Investigation outputs written to {output_path}")
+
+    elif args.watch:
+        output_path = utils.get_batch_output_path(args.watch)
+        watcher = Watcher(url_scan, output_path.with_name(f"{output_path.stem}.watch.jsonl"), sys.stdout,
+                          args.watch_interval, args.private)
+        await watcher.watch(args.watch, args.workers)
+
+    elif args.batch_retrieve:
+        await url_scan.batch_retrieve(args.batch_retrieve, sys.stdout, args.workers,
+                                      output_format=args.output_format)
+
+    elif args.batch_get_report and args.extract:
+        sections = args.sections.split(",") if args.sections else None
+        with Extractor(args.extract, args.extract_format, sections) as extractor:
+            await url_scan.batch_retrieve(args.batch_get_report, sys.stdout, args.workers, reports=True,
+                                          extractor=extractor)
+
+    elif args.batch_get_report:
+        await url_scan.batch_retrieve(args.batch_get_report, sys.stdout, args.workers, reports=True)
+
+    elif args.search_query and args.ndjson:
+        async for result in url_scan.iter_search(args.search_query, args.limit):
+            print(json.dumps(result, default=str), flush=True)
+
+    elif args.search_query:
+        results = await url_scan.search(args.search_query)
+        if results:
+            print(json.dumps(results, indent=1, default=str))
+
+    elif args.get_report:
+        results = await url_scan.get_result_data(args.get_report)
+        if results:
+            print(json.dumps(results, indent=1, default=str))
@@ -0,0 +1,221 @@
+import sqlite3
+from pathlib import Path
+
+from . import fastjson
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+def dig(body, *keys):
+    for key in keys:
+        if not isinstance(body, dict):
+            return None
+        body = body.get(key)
+    return body
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_str(value):
+    return None if value is None else str(value)
+
+
+def to_bool(value):
+    return None if value is None else bool(value)
+
+
+# Column types are given as the converter applied to every value, which also picks the type in each sink
+SECTIONS = {
+    "page": (
+        ("scan_uuid", to_str), ("time", to_str), ("url", to_str), ("domain", to_str), ("ip", to_str),
+        ("asn", to_str), ("country", to_str), ("server", to_str), ("title", to_str), ("malicious", to_bool),
+        ("score", to_int)
+    ),
+    "requests": (
+        ("scan_uuid", to_str), ("url", to_str), ("method", to_str), ("resource_type", to_str), ("status", to_int),
+        ("mime_type", to_str), ("ip", to_str), ("port", to_int), ("protocol", to_str), ("size", to_int),
+        ("transferred", to_int), ("hash", to_str), ("asn", to_str), ("country", to_str)
+    ),
+    "domains": (("scan_uuid", to_str), ("domain", to_str)),
+    "ips": (("scan_uuid", to_str), ("ip", to_str)),
+    "certificates": (
+        ("scan_uuid", to_str), ("subject_name", to_str), ("issuer", to_str), ("valid_from", to_int),
+        ("valid_to", to_int), ("san_list", to_str)
+    )
+}
+
+
+def page_records(body):
+    page = body.get("page", {})
+    overall = dig(body, "verdicts", "overall") or {}
+    yield {
+        "time": dig(body, "task", "time"), "url": dig(body, "task", "url"), "domain": page.get("domain"),
+        "ip": page.get("ip"), "asn": page.get("asn"), "country": page.get("country"), "server": page.get("server"),
+        "title": page.get("title"), "malicious": overall.get("malicious"), "score": overall.get("score")
+    }
+
+
+def request_records(body):
+    for request in dig(body, "data", "requests") or []:
+        response = request.get("response") or {}
+        yield {
+            "url": dig(request, "request", "request", "url"),
+            "method": dig(request, "request", "request", "method"),
+            "resource_type": dig(request, "request", "type"),
+            "status": dig(response, "response", "status"),
+            "mime_type": dig(response, "response", "mimeType"),
+            # Chrome reports IPv6 addresses in brackets, everywhere else in the result they are bare
+            "ip": (dig(response, "response", "remoteIPAddress") or "").strip("[]") or None,
+            "port": dig(response, "response", "remotePort"),
+            "protocol": dig(response, "response", "protocol"),
+            "size": response.get("dataLength"),
+            "transferred": response.get("encodedDataLength"),
+            "hash": response.get("hash"),
+            "asn": dig(response, "asn", "asn"),
+            "country": dig(response, "geoip", "country")
+        }
+
+
+def certificate_records(body):
+    for certificate in dig(body, "lists", "certificates") or []:
+        yield {
+            "subject_name": certificate.get("subjectName"), "issuer": certificate.get("issuer"),
+            "valid_from": certificate.get("validFrom"), "valid_to": certificate.get("validTo"),
+            "san_list": " ".join(certificate.get("sanList") or [])
+        }
+
+
+EXTRACTORS = {
+    "page": page_records,
+    "requests": request_records,
+    "domains": lambda body: ({"domain": domain} for domain in dig(body, "lists", "domains") or []),
+    "ips": lambda body: ({"ip": ip} for ip in dig(body, "lists", "ips") or []),
+    "certificates": certificate_records
+}
+
+
+class NdjsonSink:
+    SUFFIX = ".ndjson"
+
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self.files = {}
+
+    def write(self, section, records):
+        if section not in self.files:
+            self.files[section] = open(self.output_dir.joinpath(f"{section}{self.SUFFIX}"), "w", encoding="utf-8")
+        self.files[section].write("".join(fastjson.dumps(record) + "\n" for record in records))
+        self.files[section].flush()
+
+    def close(self):
+        for output_file in self.files.values():
+            output_file.close()
+
+
+class SqliteSink:
+    TYPES = {to_str: "TEXT", to_int: "INTEGER", to_bool: "INTEGER"}
+
+    def __init__(self, output_dir):
+        self.db = sqlite3.connect(Path(output_dir).joinpath("extract.sqlite"))
+        for section, columns in SECTIONS.items():
+            definition = ", ".join(f"{name} {self.TYPES[convert]}" for name, convert in columns)
+            self.db.execute(f"CREATE TABLE IF NOT EXISTS {section} ({definition})")
+        self.db.commit()
+
+    def write(self, section, records):
+        columns = [name for name, _ in SECTIONS[section]]
+        with self.db:
+            self.db.executemany(f"INSERT INTO {section} VALUES ({', '.join('?' * len(columns))})",
+                                [[record[column] for column in columns] for record in records])
+
+    def close(self):
+        self.db.close()
+
+
+class ParquetSink:
+    SUFFIX = ".parquet"
+
+    def __init__(self, output_dir):
+        if pyarrow is None:
+            raise ValueError("Parquet output requires the pyarrow package to be installed")
+        self.output_dir = Path(output_dir)
+        types = {to_str: pyarrow.string(), to_int: pyarrow.int64(), to_bool: pyarrow.bool_()}
+        self.schemas = {section: pyarrow.schema([(name, types[convert]) for name, convert in columns])
+                        for section, columns in SECTIONS.items()}
+        self.writers = {}
+
+    def write(self, section, records):
+        # Every batch becomes a row group, so the file is readable up to the last batch even if the run stops
+        if section not in self.writers:
+            self.writers[section] = pyarrow.parquet.ParquetWriter(
+                self.output_dir.joinpath(f"{section}{self.SUFFIX}"), self.schemas[section]
+            )
+        self.writers[section].write_table(pyarrow.Table.from_pylist(records, schema=self.schemas[section]))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+SINKS = {
+    "ndjson": NdjsonSink,
+    "sqlite": SqliteSink,
+    "parquet": ParquetSink
+}
+
+
+class Extractor:
+    DEFAULT_BATCH_SIZE = 1000
+
+    def __init__(self, output_dir, output_format="ndjson", sections=None, batch_size=DEFAULT_BATCH_SIZE):
+        sections = list(sections or SECTIONS)
+        unknown = set(sections) - set(SECTIONS)
+        if unknown:
+            raise ValueError(f"Unknown report sections {sorted(unknown)}, expected some of {list(SECTIONS)}")
+        if output_format not in SINKS:
+            raise ValueError(f"Unsupported output format {output_format}, expected one of {list(SINKS)}")
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        self.sink = SINKS[output_format](output_dir)
+        self.sections = sections
+        self.batch_size = batch_size
+        self.batches = {section: [] for section in sections}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excinfo):
+        self.close()
+
+    def add(self, scan_uuid, body):
+        counts = {}
+        for section in self.sections:
+            columns = SECTIONS[section]
+            batch = self.batches[section]
+            count = 0
+            for record in EXTRACTORS[section](body):
+                record["scan_uuid"] = scan_uuid
+                batch.append({name: convert(record.get(name)) for name, convert in columns})
+                count += 1
+            counts[section] = count
+            if len(batch) >= self.batch_size:
+                self.flush(section)
+        return counts
+
+    def flush(self, section):
+        if self.batches[section]:
+            self.sink.write(section, self.batches[section])
+            self.batches[section] = []
+
+    def close(self):
+        for section in self.sections:
+            self.flush(section)
+        self.sink.close()
@@ -0,0 +1,40 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(content):
+    if orjson:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def dumps(obj):
+    if orjson:
+        return orjson.dumps(obj, default=str).decode("utf-8")
+    return json.dumps(obj, default=str)
+
+
+def project(body, paths):
+    # Keeps the nesting of the original document, eg "task.domURL" gives {"task": {"domURL": ...}}
+    projection = {}
+    for path in paths:
+        keys = path.split(".")
+        value = body
+        try:
+            for key in keys:
+                value = value[key]
+        except (KeyError, TypeError):
+            continue
+        target = projection
+        for key in keys[:-1]:
+            target = target.setdefault(key, {})
+        target[keys[-1]] = value
+    return projection
+
+
+def loads_projection(content, paths):
+    return project(loads(content), paths)
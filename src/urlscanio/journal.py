@@ -0,0 +1,53 @@
+import json
+import os
+from pathlib import Path
+
+
+class Journal:
+    SUBMITTED = "submitted"
+    FETCHED = "fetched"
+    DOWNLOADED = "downloaded"
+    DONE = "done"
+    FAILED = "failed"
+    CHECKED = "checked"
+
+    def __init__(self, path, resume=False):
+        self.path = Path(path)
+        # Only entries from a previous run are kept in memory, new ones are just appended to disk
+        self.entries = {}
+        if resume and self.path.exists():
+            self.load()
+        self.file = open(self.path, "a" if resume else "w", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excinfo):
+        self.close()
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave a partially written last line behind
+                    continue
+                self.entries.setdefault(entry["url"], {}).update(entry)
+        # Rewrite the journal with one merged entry per URL, so that a watch recording every check of its URLs
+        # doesn't pile up lines to read again on every start
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as journal_file:
+            for entry in self.entries.values():
+                journal_file.write(json.dumps(entry, default=str) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def get(self, url):
+        return self.entries.get(url, {})
+
+    def record(self, url, state, **fields):
+        self.file.write(json.dumps({"url": url, "state": state, **fields}, default=str) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,61 @@
+from .ratelimit import RateLimiter
+
+
+class ApiKey:
+    def __init__(self, key, rate_limiter=None, private=True, public=True):
+        self.key = key
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.private = private
+        self.public = public
+        self.revoked = False
+
+    def __repr__(self):
+        # Keys end up in log messages, which must not leak them
+        return f"API key ...{self.key[-4:]}"
+
+    def allows(self, private):
+        if private is None:
+            return True
+        return self.private if private else self.public
+
+
+class KeyPool:
+    def __init__(self, keys):
+        self.keys = list(keys)
+        if not self.keys:
+            raise ValueError("At least one API key is required")
+
+    @classmethod
+    def from_strings(cls, shared="", private="", public=""):
+        # Each string holds comma separated keys. Shared keys are used for everything, the others are
+        # reserved for private or public submissions but can still be used for results and searches.
+        def split(keys):
+            return [key.strip() for key in keys.split(",") if key.strip()]
+        return cls([ApiKey(key) for key in split(shared)] +
+                   [ApiKey(key, public=False) for key in split(private)] +
+                   [ApiKey(key, private=False) for key in split(public)])
+
+    def usable(self, private=None, exclude=()):
+        return [key for key in self.keys if not key.revoked and key.allows(private) and key not in exclude]
+
+    def select(self, action, private=None, exclude=()):
+        keys = self.usable(private, exclude) or self.usable(private)
+        if not keys:
+            visibility = "private" if private else "public"
+            raise ValueError(f"No API key is allowed to submit {visibility} scans")
+        return max(keys, key=lambda key: key.rate_limiter.headroom(action))
+
+    async def acquire(self, action, private=None, exclude=()):
+        key = self.select(action, private, exclude)
+        await key.rate_limiter.acquire(action)
+        return key
+
+    def has_headroom(self, action, private=None, exclude=()):
+        return any(key.rate_limiter.headroom(action) >= 1 for key in self.usable(private, exclude))
+
+    def revoke(self, key, private=None):
+        # The last usable key is kept, so that requests keep failing with UrlScan's own error message
+        if len(self.usable(private)) < 2:
+            return False
+        key.revoked = True
+        return True
@@ -0,0 +1,137 @@
+import json
+import os
+from collections import Counter, defaultdict
+from pathlib import Path
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = None
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the quantile, precise enough to tell seconds from minutes. The last
+        # bucket has no bound, so the largest value observed is used instead.
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99)
+        }
+
+
+class Metrics:
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    SCAN_BUCKETS = (5, 10, 15, 20, 30, 45, 60, 90, 120, 300)
+    POLL_BUCKETS = (1, 2, 3, 4, 5, 7, 10, 15)
+
+    def __init__(self):
+        self.request_latency = defaultdict(lambda: Histogram(self.LATENCY_BUCKETS))
+        self.status_codes = Counter()
+        self.poll_attempts = Histogram(self.POLL_BUCKETS)
+        self.time_to_result = Histogram(self.SCAN_BUCKETS)
+        self.bytes_downloaded = 0
+        self.downloads_skipped = 0
+        self.rate_limit_remaining = {}
+
+    def observe_request(self, endpoint, status, latency):
+        self.request_latency[endpoint].observe(latency)
+        self.status_codes[(endpoint, status)] += 1
+
+    def observe_poll(self, attempts, time_to_result=None):
+        self.poll_attempts.observe(attempts)
+        if time_to_result is not None:
+            self.time_to_result.observe(time_to_result)
+
+    def observe_download(self, size):
+        self.bytes_downloaded += size
+
+    def observe_skipped_download(self):
+        self.downloads_skipped += 1
+
+    def observe_rate_limit(self, action, remaining):
+        self.rate_limit_remaining[action] = remaining
+
+    def summary(self):
+        status_codes = defaultdict(dict)
+        for (endpoint, status), count in self.status_codes.items():
+            status_codes[endpoint][str(status)] = count
+        return {
+            "request_latency": {endpoint: histogram.summary() for endpoint, histogram in self.request_latency.items()},
+            "status_codes": dict(status_codes),
+            "poll_attempts": self.poll_attempts.summary(),
+            "time_to_result": self.time_to_result.summary(),
+            "bytes_downloaded": self.bytes_downloaded,
+            "downloads_skipped": self.downloads_skipped,
+            "rate_limit_remaining": dict(self.rate_limit_remaining)
+        }
+
+    @staticmethod
+    def prometheus_histogram(name, histogram, labels=""):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+            cumulative += count
+            separator = "," if labels else ""
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {histogram.sum}")
+        lines.append(f"{name}_count{suffix} {histogram.count}")
+        return lines
+
+    def to_prometheus(self):
+        lines = ["# TYPE urlscanio_request_duration_seconds histogram"]
+        for endpoint, histogram in self.request_latency.items():
+            lines += self.prometheus_histogram("urlscanio_request_duration_seconds", histogram,
+                                               f'endpoint="{endpoint}"')
+        lines.append("# TYPE urlscanio_responses_total counter")
+        for (endpoint, status), count in self.status_codes.items():
+            lines.append(f'urlscanio_responses_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+        lines.append("# TYPE urlscanio_poll_attempts histogram")
+        lines += self.prometheus_histogram("urlscanio_poll_attempts", self.poll_attempts)
+        lines.append("# TYPE urlscanio_time_to_result_seconds histogram")
+        lines += self.prometheus_histogram("urlscanio_time_to_result_seconds", self.time_to_result)
+        lines.append("# TYPE urlscanio_downloaded_bytes_total counter")
+        lines.append(f"urlscanio_downloaded_bytes_total {self.bytes_downloaded}")
+        lines.append("# TYPE urlscanio_downloads_skipped_total counter")
+        lines.append(f"urlscanio_downloads_skipped_total {self.downloads_skipped}")
+        lines.append("# TYPE urlscanio_rate_limit_remaining gauge")
+        for action, remaining in self.rate_limit_remaining.items():
+            lines.append(f'urlscanio_rate_limit_remaining{{action="{action}"}} {remaining}')
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def write_atomically(path, content):
+        # The node_exporter textfile collector may read the file at any time, so never expose a partial one
+        path = Path(path)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(content, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def write_json(self, path):
+        self.write_atomically(path, json.dumps(self.summary(), indent=1, allow_nan=False))
+
+    def write_prometheus(self, path):
+        self.write_atomically(path, self.to_prometheus())
@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            self.refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.refill()
+            self.tokens -= 1
+
+    def update(self, limit, remaining, window, reset_after):
+        self.refill()
+        self.capacity = max(limit, 1)
+        self.rate = self.capacity / window
+        if remaining > 0:
+            self.tokens = min(float(remaining), self.capacity)
+        else:
+            # Out of quota: go negative so the next token only becomes available once the window resets
+            self.tokens = 1 - reset_after * self.rate
+
+
+class RateLimiter:
+    WINDOW_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+
+    # (requests per second, burst) used until urlscan tells us the actual quota for an action
+    DEFAULT_RATES = {
+        "scan": (0.5, 1),
+        "result": (2, 5),
+        "search": (1, 1)
+    }
+
+    def __init__(self, default_rates=None):
+        self.default_rates = default_rates or self.DEFAULT_RATES
+        self.buckets = {}
+
+    def bucket(self, action):
+        if action not in self.buckets:
+            rate, capacity = self.default_rates.get(action, (1, 1))
+            self.buckets[action] = TokenBucket(rate, capacity)
+        return self.buckets[action]
+
+    async def acquire(self, action):
+        await self.bucket(action).acquire()
+
+    def update(self, action, headers):
+        try:
+            limit = int(headers["X-Rate-Limit-Limit"])
+            remaining = int(headers["X-Rate-Limit-Remaining"])
+            reset_after = float(headers.get("X-Rate-Limit-Reset-After", 0))
+            window = self.WINDOW_SECONDS.get(headers.get("X-Rate-Limit-Window"), 60)
+        except (KeyError, ValueError):
+            return False
+        self.bucket(action).update(limit, remaining, window, reset_after)
+        return True
+
+    def headroom(self, action):
+        # Unlike remaining, goes negative when exhausted, the further the longer until the quota resets
+        bucket = self.bucket(action)
+        bucket.refill()
+        return bucket.tokens
+
+    def remaining(self, action):
+        return max(int(self.headroom(action)), 0)
@@ -0,0 +1,96 @@
+import sqlite3
+from pathlib import Path
+
+from . import fastjson
+
+
+class ReportStore:
+    # Only columns of the reports table are returned by searches, the full text ones are only searched
+    COLUMNS = ("uuid", "time", "url", "domain", "ip", "asn", "title", "malicious", "score")
+    TEXT_COLUMNS = ("urls", "domains", "ips", "asns", "hashes", "certificates", "title", "verdicts")
+    DEFAULT_LIMIT = 100
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS reports (uuid TEXT PRIMARY KEY, time TEXT, url TEXT, domain TEXT, ip TEXT, "
+            "asn TEXT, title TEXT, malicious INTEGER, score INTEGER)"
+        )
+        # The default tokenizer splits domains, URLs and IPs on punctuation, so that a phrase query such as
+        # "example.com" also matches www.example.com and https://example.com/login
+        self.db.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5({', '.join(self.TEXT_COLUMNS)})")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def contains(self, scan_uuid):
+        return self.db.execute("SELECT 1 FROM reports WHERE uuid = ?", (str(scan_uuid),)).fetchone() is not None
+
+    @staticmethod
+    def names(values):
+        # Brands and certificates are objects, everything else in lists and verdicts is a plain string
+        names = []
+        for value in values or []:
+            if isinstance(value, dict):
+                names += [str(value[key]) for key in ("name", "key", "subjectName", "issuer") if value.get(key)]
+                names += [str(name) for name in value.get("sanList", [])]
+            else:
+                names.append(str(value))
+        return " ".join(names)
+
+    @classmethod
+    def extract(cls, body):
+        task, page, lists = body.get("task", {}), body.get("page", {}), body.get("lists", {})
+        overall = body.get("verdicts", {}).get("overall", {})
+        row = {
+            "uuid": task.get("uuid"),
+            "time": task.get("time"),
+            "url": task.get("url"),
+            "domain": page.get("domain"),
+            "ip": page.get("ip"),
+            "asn": page.get("asn"),
+            "title": page.get("title"),
+            "malicious": int(bool(overall.get("malicious"))),
+            "score": overall.get("score")
+        }
+        verdicts = ["malicious"] if overall.get("malicious") else []
+        for key in ("categories", "brands", "tags"):
+            verdicts.append(cls.names(overall.get(key)))
+        text = {
+            "urls": cls.names([task.get("url"), page.get("url"), *lists.get("urls", [])]),
+            "domains": cls.names([page.get("domain"), *lists.get("domains", []), *lists.get("linkDomains", [])]),
+            "ips": cls.names([page.get("ip"), *lists.get("ips", [])]),
+            "asns": cls.names([page.get("asn"), page.get("asnname"), *lists.get("asns", [])]),
+            "hashes": cls.names(lists.get("hashes")),
+            "certificates": cls.names(lists.get("certificates")),
+            "title": page.get("title") or "",
+            "verdicts": " ".join(verdict for verdict in verdicts if verdict)
+        }
+        return row, text
+
+    def ingest(self, scan_uuid, content):
+        # Results never change once a scan is finished, so a result already in the store is not parsed again
+        if self.contains(scan_uuid):
+            return False
+        row, text = self.extract(fastjson.loads(content))
+        row["uuid"] = str(scan_uuid)
+        with self.db:
+            cursor = self.db.execute(f"INSERT INTO reports VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                                     [row[column] for column in self.COLUMNS])
+            self.db.execute(f"INSERT INTO reports_fts (rowid, {', '.join(self.TEXT_COLUMNS)}) "
+                            f"VALUES (?, {', '.join('?' * len(self.TEXT_COLUMNS))})",
+                            [cursor.lastrowid, *[text[column] for column in self.TEXT_COLUMNS]])
+        return True
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        columns = ", ".join(f"reports.{column}" for column in self.COLUMNS)
+        try:
+            rows = self.db.execute(
+                f"SELECT {columns} FROM reports_fts JOIN reports ON reports.rowid = reports_fts.rowid "
+                "WHERE reports_fts MATCH ? ORDER BY reports.time DESC LIMIT ?", (query, limit)
+            ).fetchall()
+        except sqlite3.OperationalError as error:
+            raise ValueError(f"Invalid local search query {query}: {error}") from error
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
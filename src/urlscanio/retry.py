@@ -0,0 +1,97 @@
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+
+class Deadline:
+    def __init__(self, seconds=None):
+        # None never expires, eg for downloads only bounded by the transport's read timeout
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self):
+        return float("inf") if self.expires_at is None else self.expires_at - time.monotonic()
+
+    async def bound(self, awaitable):
+        if self.expires_at is None:
+            return await awaitable
+        return await asyncio.wait_for(awaitable, max(self.remaining(), 0))
+
+    async def paused(self, awaitable):
+        started_at = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            if self.expires_at is not None:
+                self.expires_at += time.monotonic() - started_at
+
+
+class RetryPolicy:
+    RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+    RETRYABLE_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+    def __init__(self, max_attempts=5, base_delay=1, max_delay=60, deadline=300):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def without_deadline(self):
+        return RetryPolicy(self.max_attempts, self.base_delay, self.max_delay, deadline=None)
+
+    @staticmethod
+    def parse_retry_after(headers):
+        retry_after = headers.get("Retry-After")
+        if retry_after:
+            try:
+                return max(float(retry_after), 0)
+            except ValueError:
+                pass
+            try:
+                return max((parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds(), 0)
+            except (TypeError, ValueError):
+                pass
+        try:
+            return max(float(headers["X-Rate-Limit-Reset-After"]), 0)
+        except (KeyError, ValueError):
+            return None
+
+    def delay(self, attempt, headers=None):
+        retry_after = self.parse_retry_after(headers or {})
+        if retry_after is not None:
+            return retry_after
+        backoff = min(self.base_delay * 2 ** (attempt - 1), self.max_delay)
+        return backoff * random.uniform(0.5, 1)
+
+    def start_deadline(self):
+        return Deadline(self.deadline)
+
+    async def run(self, call, logger, description, deadline=None):
+        # A call given its deadline bounds itself, so that it can leave out eg waiting for rate limits
+        bounded = deadline is None
+        deadline = deadline or self.start_deadline()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                status, headers, value = await (deadline.bound(call()) if bounded else call())
+            except self.RETRYABLE_ERRORS as error:
+                status, headers, value, failure = None, {}, None, error
+                reason = repr(error)
+            else:
+                if status not in self.RETRYABLE_STATUSES:
+                    return status, value
+                failure = None
+                reason = f"{status} response code"
+
+            delay = self.delay(attempt, headers)
+            if attempt >= self.max_attempts or delay > deadline.remaining():
+                logger.info("Giving up on %s after %d attempts, last failure: %s", description, attempt, reason)
+                if failure:
+                    raise failure
+                return status, value
+            logger.info("Retrying %s in %.1fs after %s", description, delay, reason)
+            await asyncio.sleep(delay)
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+
+import aiohttp
+from aiohttp import web
+
+from . import fastjson, utils
+from .retry import RetryPolicy
+
+
+def parse_address(address):
+    # Either unix:/path/to/socket or [host]:port, the host defaulting to the loopback interface
+    if address.startswith("unix:"):
+        return address[len("unix:"):], None
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class ScanService:
+    DEFAULT_JOBS = 5
+    # Checked as the CLI checks them, since they end up in UrlScan.io URLs and in paths inside the data directory
+    VALIDATORS = {"url": utils.is_url_valid, "uuid": utils.is_uuid_valid}
+
+    def __init__(self, url_scan, jobs=DEFAULT_JOBS):
+        self.url_scan = url_scan
+        # Jobs from every client wait in the same FIFO queue, so one busy client cannot starve the others
+        self.scheduler = asyncio.Semaphore(jobs)
+        self.logger = url_scan.logger
+        self.runner = None
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/investigate", self.investigate)
+        app.router.add_post("/retrieve", self.retrieve)
+        app.router.add_post("/submit", self.submit)
+        app.router.add_post("/search", self.search)
+        app.router.add_post("/report", self.report)
+        app.router.add_get("/metrics", self.metrics)
+        return app
+
+    async def start(self, address):
+        path, port = parse_address(address)
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        if port is None:
+            site = web.UnixSite(self.runner, path)
+        else:
+            site = web.TCPSite(self.runner, path, port)
+        await site.start()
+        self.logger.critical("Listening for scan jobs on %s", address)
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def serve_forever(self, address):
+        await self.start(address)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
+
+    @staticmethod
+    def respond(body, status=200):
+        return web.json_response(body, status=status, dumps=fastjson.dumps)
+
+    @classmethod
+    async def read_payload(cls, request, field):
+        try:
+            payload = await request.json(loads=fastjson.loads)
+        except ValueError:
+            return None
+        if not isinstance(payload, dict) or not isinstance(payload.get(field), str):
+            return None
+        validate = cls.VALIDATORS.get(field)
+        if validate and not validate(payload[field]):
+            return None
+        return payload
+
+    def bad_request(self, field):
+        return self.respond({"error": f"Expected a JSON object with a valid {field} string"}, 400)
+
+    async def schedule(self, job, *args):
+        async with self.scheduler:
+            try:
+                return self.respond(await job(*args))
+            except (KeyError, *RetryPolicy.RETRYABLE_ERRORS) as error:
+                self.logger.critical("Job %s%r failed: %r", job.__name__, args, error)
+                return self.respond({"error": repr(error)}, 502)
+
+    async def investigate(self, request):
+        payload = await self.read_payload(request, "url")
+        if payload is None:
+            return self.bad_request("url")
+        return await self.schedule(self.url_scan.investigate, payload["url"], bool(payload.get("private")))
+
+    async def retrieve(self, request):
+        payload = await self.read_payload(request, "uuid")
+        if payload is None:
+            return self.bad_request("uuid")
+        return await self.schedule(self.url_scan.fetch_result, payload["uuid"])
+
+    async def submit(self, request):
+        payload = await self.read_payload(request, "url")
+        if payload is None:
+            return self.bad_request("url")
+        return await self.schedule(self.url_scan.submit_scan_request, payload["url"], bool(payload.get("private")))
+
+    async def report(self, request):
+        payload = await self.read_payload(request, "uuid")
+        if payload is None:
+            return self.bad_request("uuid")
+        return await self.schedule(self.url_scan.get_result_data, payload["uuid"])
+
+    async def search(self, request):
+        payload = await self.read_payload(request, "query")
+        if payload is None:
+            return self.bad_request("query")
+        if not payload.get("ndjson"):
+            return await self.schedule(self.url_scan.search, payload["query"])
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        async with self.scheduler:
+            async for result in self.url_scan.iter_search(payload["query"], payload.get("limit")):
+                await response.write(fastjson.dumps(result).encode("utf-8") + b"\n")
+        await response.write_eof()
+        return response
+
+    async def metrics(self, _):
+        return web.Response(text=self.url_scan.metrics.to_prometheus(), content_type="text/plain")
+
+
+class ServiceClient:
+    CONNECT_TIMEOUT = 10
+
+    def __init__(self, address, log_level=0):
+        path, port = parse_address(address)
+        if port is None:
+            # The host is only used for the Host header, the connection always goes through the socket
+            self.base_url = "http://urlscanio"
+            connector = aiohttp.UnixConnector(path=path)
+        else:
+            self.base_url = f"http://{path}:{port}"
+            connector = aiohttp.TCPConnector()
+        # An investigation lasts as long as the scan does, so only connecting to the service is bounded
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.CONNECT_TIMEOUT)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        self.logger = logging.getLogger("urlscanio")
+        self.logger.setLevel(log_level)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *excinfo):
+        await self.session.close()
+
+    def post(self, endpoint, payload):
+        return self.session.post(f"{self.base_url}/{endpoint}", data=fastjson.dumps(payload),
+                                 headers={"Content-Type": "application/json"})
+
+    async def check_response(self, endpoint, response):
+        if response.status != 200:
+            # Errors the service did not handle itself are answered by aiohttp, with a plain text body
+            content = await response.text()
+            try:
+                error = fastjson.loads(content)["error"]
+            except (ValueError, KeyError, TypeError):
+                error = content or f"{response.status} response code"
+            self.logger.critical("The urlscanio service could not run %s: %s", endpoint, error)
+            raise RuntimeError(error)
+
+    async def call(self, endpoint, payload):
+        async with self.post(endpoint, payload) as response:
+            await self.check_response(endpoint, response)
+            return await response.json(loads=fastjson.loads)
+
+    async def investigate(self, url, private=False):
+        return await self.call("investigate", {"url": url, "private": private})
+
+    async def fetch_result(self, scan_uuid):
+        return await self.call("retrieve", {"uuid": scan_uuid})
+
+    async def submit_scan_request(self, url, private=False):
+        return await self.call("submit", {"url": url, "private": private})
+
+    async def get_result_data(self, scan_uuid):
+        return await self.call("report", {"uuid": scan_uuid})
+
+    async def search(self, query):
+        return await self.call("search", {"query": query})
+
+    async def iter_search(self, query, limit=None):
+        async with self.post("search", {"query": query, "limit": limit, "ndjson": True}) as response:
+            await self.check_response("search", response)
+            async for line in response.content:
+                if line.strip():
+                    yield fastjson.loads(line)
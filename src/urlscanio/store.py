@@ -0,0 +1,111 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import uuid
+import zlib
+from pathlib import Path
+
+import aiofiles
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class BlobWriter:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.compressor = store.compressor()
+        self.tmp_path = store.blob_dir.joinpath(f".{uuid.uuid4()}.tmp")
+        self.file = None
+        self.location = None
+
+    async def __aenter__(self):
+        self.file = await aiofiles.open(self.tmp_path, "wb")
+        return self
+
+    async def write(self, chunk):
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        await self.file.write(self.compressor.compress(chunk))
+
+    async def __aexit__(self, exc_type, *excinfo):
+        try:
+            if exc_type is None:
+                await self.file.write(self.compressor.flush())
+            await self.file.close()
+            if exc_type is None:
+                self.location = self.store.commit(self.name, self.digest.hexdigest(), self.size, self.tmp_path)
+        finally:
+            self.tmp_path.unlink(missing_ok=True)
+
+
+class ArtifactStore:
+    SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+    def __init__(self, store_dir, compression="gzip"):
+        if compression not in self.SUFFIXES:
+            raise ValueError(f"Unsupported compression {compression}, expected one of {list(self.SUFFIXES)}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package to be installed")
+        self.store_dir = Path(store_dir)
+        self.compression = compression
+        self.blob_dir = self.store_dir.joinpath("blobs")
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.index = sqlite3.connect(self.store_dir.joinpath("index.sqlite"))
+        self.index.execute("CREATE TABLE IF NOT EXISTS artifacts (name TEXT PRIMARY KEY, digest TEXT, size INTEGER)")
+        self.index.commit()
+
+    def close(self):
+        self.index.close()
+
+    def compressor(self):
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor().compressobj()
+        # wbits=31 produces a gzip container, so blobs can also be read with gunzip
+        return zlib.compressobj(wbits=31)
+
+    def blob_path(self, digest, compression=None):
+        suffix = self.SUFFIXES[compression or self.compression]
+        return self.blob_dir.joinpath(digest[:2], f"{digest}{suffix}")
+
+    def open_blob(self, name):
+        return BlobWriter(self, name)
+
+    def commit(self, name, digest, size, tmp_path):
+        blob_path = self.blob_path(digest)
+        if blob_path.exists():
+            tmp_path.unlink()
+        else:
+            blob_path.parent.mkdir(exist_ok=True)
+            os.replace(tmp_path, blob_path)
+        self.index.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?)", (name, digest, size))
+        self.index.commit()
+        return blob_path
+
+    def lookup(self, name):
+        row = self.index.execute("SELECT digest FROM artifacts WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        # The store may have been written to with another compression setting
+        for compression in self.SUFFIXES:
+            blob_path = self.blob_path(row[0], compression)
+            if blob_path.exists():
+                return blob_path
+        return None
+
+    def read(self, name):
+        blob_path = self.lookup(name)
+        if blob_path is None:
+            return None
+        content = blob_path.read_bytes()
+        if blob_path.suffix == self.SUFFIXES["zstd"]:
+            if zstandard is None:
+                raise ValueError(f"{name} is zstd compressed, reading it requires the zstandard package")
+            return zstandard.ZstdDecompressor().decompressobj().decompress(content)
+        return gzip.decompress(content)
@@ -0,0 +1,140 @@
+import contextvars
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class Span:
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        # Every span belongs to the trace of its root span, eg the investigation of one URL
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.attributes = dict(attributes or {})
+        self.started_at = time.time_ns()
+        self.ended_at = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def tags(self):
+        # The URL and scan UUID are set on an ancestor, often after its first children started
+        tags = {}
+        ancestor = self.parent
+        while ancestor:
+            for key in Tracer.INHERITED:
+                if key in ancestor.attributes:
+                    tags.setdefault(key, ancestor.attributes[key])
+            ancestor = ancestor.parent
+        return {**tags, **self.attributes}
+
+
+class Tracer:
+    INHERITED = ("url", "scan_uuid")
+    FORMATS = ("chrome", "otlp")
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started_at = time.time_ns()
+        self.spans = []
+        self.open = set()
+        self.current = contextvars.ContextVar("span", default=None)
+
+    def start(self, name, parent=None, **attributes):
+        span = Span(name, parent, attributes)
+        if self.enabled:
+            self.open.add(span)
+        return span
+
+    def end(self, span):
+        if span is None or span.ended_at is not None:
+            return
+        span.ended_at = time.time_ns()
+        if self.enabled:
+            self.open.discard(span)
+            self.spans.append(span)
+
+    @contextmanager
+    def activate(self, span):
+        token = self.current.set(span)
+        try:
+            yield span
+        finally:
+            self.current.reset(token)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = self.start(name, self.current.get(), **attributes)
+        try:
+            with self.activate(span):
+                yield span
+        except BaseException as error:
+            span.set(error=repr(error))
+            raise
+        finally:
+            self.end(span)
+
+    def finished_spans(self):
+        # Spans still open when the run stopped, eg because it was interrupted, end when the trace is written
+        now = time.time_ns()
+        for span in self.open:
+            span.set(unfinished=True)
+            span.ended_at = now
+        return sorted(self.spans + list(self.open), key=lambda span: span.started_at)
+
+    def to_chrome(self):
+        # One thread per trace, so that a viewer such as Perfetto shows each URL on its own row
+        threads = {}
+        events = []
+        for span in self.finished_spans():
+            tid = threads.setdefault(span.trace_id, len(threads) + 1)
+            events.append({
+                "name": span.name, "cat": "urlscanio", "ph": "X", "pid": 1, "tid": tid,
+                "ts": (span.started_at - self.started_at) / 1000, "dur": (span.ended_at - span.started_at) / 1000,
+                "args": span.tags()
+            })
+            if span.parent is None:
+                label = span.attributes.get("url") or span.attributes.get("scan_uuid") or span.name
+                events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": label}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    @staticmethod
+    def otlp_value(value):
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def to_otlp(self):
+        spans = []
+        for span in self.finished_spans():
+            tags = span.tags()
+            spans.append({
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent.span_id if span.parent else "",
+                "name": span.name,
+                # 3 is SPAN_KIND_CLIENT, for calls to UrlScan.io, and 1 is SPAN_KIND_INTERNAL
+                "kind": 3 if "http.request.method" in tags else 1,
+                "startTimeUnixNano": str(span.started_at),
+                "endTimeUnixNano": str(span.ended_at),
+                "attributes": [{"key": key, "value": self.otlp_value(value)} for key, value in tags.items()],
+                # 2 is STATUS_CODE_ERROR, 0 is STATUS_CODE_UNSET
+                "status": {"code": 2 if "error" in tags else 0}
+            })
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "urlscanio"}}]},
+            "scopeSpans": [{"scope": {"name": "urlscanio"}, "spans": spans}]
+        }]}
+
+    def write(self, path, output_format="chrome"):
+        if output_format not in self.FORMATS:
+            raise ValueError(f"Unsupported trace format {output_format}, expected one of {list(self.FORMATS)}")
+        trace = self.to_chrome() if output_format == "chrome" else self.to_otlp()
+        Path(path).write_text(json.dumps(trace, default=str), encoding="utf-8")
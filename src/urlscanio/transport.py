@@ -0,0 +1,43 @@
+import asyncio
+import logging
+import platform
+
+import aiohttp
+
+DEFAULT_LIMIT = 100
+DEFAULT_LIMIT_PER_HOST = 20
+DEFAULT_KEEPALIVE_TIMEOUT = 30
+DEFAULT_DNS_CACHE_TTL = 300
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+
+
+def create_session(limit=DEFAULT_LIMIT, limit_per_host=DEFAULT_LIMIT_PER_HOST,
+                   keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT, dns_cache_ttl=DEFAULT_DNS_CACHE_TTL,
+                   connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT):
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=keepalive_timeout,
+        use_dns_cache=dns_cache_ttl is not None,
+        ttl_dns_cache=dns_cache_ttl
+    )
+    # Only the connect and per-read timeouts are bounded, large downloads may legitimately take a while overall
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout, sock_read=read_timeout)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, trust_env=True)
+
+
+def install_event_loop_policy(use_uvloop=False):
+    if use_uvloop:
+        try:
+            import uvloop   # pylint: disable=C0415
+        except ImportError:
+            logging.getLogger("urlscanio").warning("uvloop is not installed, using the default event loop")
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            return True
+
+    # See https://github.com/iojw/socialscan/issues/13
+    if platform.system() == "Windows":
+        asyncio.set_event_loop_policy(policy=asyncio.WindowsSelectorEventLoopPolicy())
+    return False
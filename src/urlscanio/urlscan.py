@@ -1,23 +1,62 @@
 import asyncio
 import csv
+import hashlib
 import json
 import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 import aiofiles
-import aiohttp
 
-logging.basicConfig(format="%(asctime)s %(message)s", datefmt="%H:%M:%S")
+from . import fastjson, transport, utils
+from .batch import BatchInvestigation
+from .keypool import ApiKey, KeyPool
+from .metrics import Metrics
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy
+from .tracing import Tracer
+
 
 class UrlScan:
     URLSCAN_API_URL = "https://urlscan.io/api/v1"
     DEFAULT_PAUSE_TIME = 3
     DEFAULT_MAX_ATTEMPTS = 15
+    DEFAULT_SCAN_LATENCY = 10
+    MAX_PAUSE_TIME = 20
+    POLL_BACKOFF_FACTOR = 1.5
+    POLL_JITTER = 0.2
+    # 404 means the scan has not finished yet, 429 and 5xx are worth another try
+    RETRYABLE_POLL_STATUSES = {404, 429, 500, 502, 503, 504}
+    DEFAULT_WORKERS = 5
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024
+    DEFAULT_SEARCH_PAGE_SIZE = 100
+    # The only parts of a scan result needed to investigate it or download its artifacts
+    TASK_FIELDS = ("task.reportURL", "task.screenshotURL", "task.domURL")
 
-    def __init__(self, api_key, data_dir=Path.cwd(), log_level=0):
+    def __init__(self, api_key, data_dir=Path.cwd(), log_level=0, rate_limiter=None, result_cache=None,
+                 reuse_max_age=None, submission_index=None, session=None, artifact_store=None, metrics=None,
+                 retry_policy=None, key_pool=None, report_store=None, force_downloads=False, tracer=None):
         self.api_key = api_key
         self.data_dir = data_dir
-        self.session = aiohttp.ClientSession(trust_env=True)
+        # A session passed in is shared with other instances, so it is left to its owner to close
+        self.owns_session = session is None
+        self.session = session or transport.create_session()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.key_pool = key_pool or KeyPool([ApiKey(api_key, self.rate_limiter)])
+        self.scan_latency = self.DEFAULT_SCAN_LATENCY
+        self.result_cache = result_cache
+        self.reuse_max_age = reuse_max_age
+        self.submission_index = submission_index
+        self.artifact_store = artifact_store
+        self.report_store = report_store
+        self.force_downloads = force_downloads
+        self.tracer = tracer or Tracer(enabled=False)
+        self.metrics = metrics or Metrics()
+        self.retry_policy = retry_policy or RetryPolicy()
         self.verbose = True
         self.logger = logging.getLogger("urlscanio")
         self.logger.setLevel(log_level)
@@ -26,137 +65,540 @@ class UrlScan:
         return self
 
     async def __aexit__(self, *excinfo):
-        await self.session.close()
-
-    async def execute(self, method, url, headers=None, payload=None, params={}):
-        async with self.session.request(
-                method=method,
-                url=url,
-                headers=headers,
-                data=json.dumps(payload),
-                params=params,
-                ssl=False) as response:
-            self.logger.debug("%s request made to %s with %d response code", method, url, response.status)
-            return response.status, await response.read()
-
-    async def save_file(self, target_path, content):
-        self.logger.debug("Creating and saving %s", target_path)
-        async with aiofiles.open(target_path, "wb") as data:
-            await data.write(content)
+        if self.owns_session:
+            await self.session.close()
+
+    async def execute(self, method, url, headers=None, payload=None, params={}, action=None, private=None):
+        deadline = self.retry_policy.start_deadline()
+
+        async def exchange(key):
+            started_at = time.monotonic()
+            with self.tracer.span(f"{method} {action or 'other'}",
+                                  **{"http.request.method": method, "url.full": url}) as span:
+                async with self.session.request(
+                        method=method,
+                        url=url,
+                        headers={**(headers or {}), "API-Key": key.key} if key else headers,
+                        data=json.dumps(payload) if payload is not None else None,
+                        params=params,
+                        ssl=False) as response:
+                    self.logger.debug("%s request made to %s with %d response code", method, url, response.status)
+                    if key and key.rate_limiter.update(action, response.headers):
+                        self.logger.debug("Rate limit for %s with %r: %s of %s remaining", action, key,
+                                          response.headers["X-Rate-Limit-Remaining"],
+                                          response.headers["X-Rate-Limit-Limit"])
+                        self.metrics.observe_rate_limit(action, int(response.headers["X-Rate-Limit-Remaining"]))
+                    content = await response.read()
+                span.set(**{"http.response.status_code": response.status})
+            self.metrics.observe_request(action or "other", response.status, time.monotonic() - started_at)
+            return response.status, response.headers, content
+
+        async def send():
+            throttled = set()
+            while True:
+                key = None
+                if action:
+                    # A request waiting for quota has not started yet, so only the exchange counts towards its deadline
+                    with self.tracer.span("rate limit wait", action=action):
+                        key = await deadline.paused(self.key_pool.acquire(action, private, throttled))
+                status, response_headers, content = await deadline.bound(exchange(key))
+                if status == 401 and key and self.key_pool.revoke(key, private):
+                    self.logger.critical("UrlScan rejected %r, no longer using it", key)
+                    continue
+                # Another key with quota left is tried straight away, rather than waiting for this one to reset
+                if status == 429 and key:
+                    throttled.add(key)
+                    if self.key_pool.has_headroom(action, private, throttled):
+                        self.logger.info("%r is out of %s quota, switching keys", key, action)
+                        continue
+                return status, response_headers, content
+
+        return await self.retry_policy.run(send, self.logger, f"{method} request to {url}", deadline)
+
+    @staticmethod
+    def parse_json(content):
+        # Errors from urlscan or from a proxy in front of it, eg a 502 once retries ran out, may be HTML pages
+        try:
+            return fastjson.loads(content)
+        except ValueError:
+            return None
+
+    async def iter_download(self, response):
+        async for chunk in response.content.iter_chunked(self.DOWNLOAD_CHUNK_SIZE):
+            self.metrics.observe_download(len(chunk))
+            yield chunk
+
+    @staticmethod
+    def sidecar_path(target_path):
+        return target_path.with_name(f".{target_path.name}.meta")
+
+    def write_sidecar(self, target_path, size, digest):
+        sidecar = {"size": size, "sha256": digest}
+        self.sidecar_path(target_path).write_text(json.dumps(sidecar), encoding="utf-8")
+
+    def read_sidecar(self, target_path):
+        try:
+            return json.loads(self.sidecar_path(target_path).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def local_copy(self, target_path):
+        # Artifacts never change once a scan is finished, so a complete copy never needs to be downloaded again.
+        # Copies without a sidecar, eg written by versions which did not write them atomically, may be truncated.
+        if self.artifact_store:
+            return self.artifact_store.lookup(f"{target_path.parent.name}/{target_path.name}")
+        sidecar = self.read_sidecar(target_path)
+        try:
+            if sidecar and target_path.stat().st_size == sidecar["size"]:
+                return target_path
+        except (OSError, KeyError):
+            pass
+        return None
+
+    async def stream_to_file(self, chunks, target_path):
+        # Written next to the target so that the final rename stays on the same filesystem
+        tmp_path = target_path.with_name(f".{target_path.name}.part")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, "wb") as data:
+                async for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    await data.write(chunk)
+            os.replace(tmp_path, target_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        self.write_sidecar(target_path, size, digest.hexdigest())
+        return target_path
+
+    async def stream_to_store(self, chunks, target_path):
+        async with self.artifact_store.open_blob(f"{target_path.parent.name}/{target_path.name}") as blob:
+            async for chunk in chunks:
+                await blob.write(chunk)
+        return blob.location
+
+    async def store_artifact(self, chunks, target_path):
+        if self.artifact_store:
+            return await self.stream_to_store(chunks, target_path)
+        return await self.stream_to_file(chunks, target_path)
+
+    async def save_artifact(self, target_path, content):
+        async def chunks():
+            yield content
+
+        return await self.store_artifact(chunks(), Path(target_path))
+
+    async def download(self, url, target_path):
+        target_path = Path(target_path)
+        if not self.force_downloads:
+            location = self.local_copy(target_path)
+            if location:
+                self.logger.debug("Skipping download of %s, %s is already complete", url, location)
+                self.metrics.observe_skipped_download()
+                return location
+
+        async def send():
+            started_at = time.monotonic()
+            with self.tracer.span(f"GET {target_path.parent.name}",
+                                  **{"http.request.method": "GET", "url.full": url}) as span:
+                async with self.session.request(method="GET", url=url, ssl=False) as response:
+                    self.logger.debug("GET request made to %s with %d response code", url, response.status)
+                    location = None
+                    if response.status == 200:
+                        location = await self.store_artifact(self.iter_download(response), target_path)
+                span.set(**{"http.response.status_code": response.status})
+            self.metrics.observe_request(target_path.parent.name, response.status, time.monotonic() - started_at)
+            return response.status, response.headers, location
+
+        # A large artifact may take longer than the deadline of API calls, stalled reads are bounded by the session
+        _, location = await self.retry_policy.without_deadline().run(send, self.logger, f"download of {url}")
+        return location
+
+    async def fetch_artifact(self, url, endpoint):
+        # Kept in memory rather than written to disk, for artifacts which may not need to be kept
+        async def send():
+            started_at = time.monotonic()
+            with self.tracer.span(f"GET {endpoint}", **{"http.request.method": "GET", "url.full": url}) as span:
+                async with self.session.request(method="GET", url=url, ssl=False) as response:
+                    self.logger.debug("GET request made to %s with %d response code", url, response.status)
+                    content = None
+                    if response.status == 200:
+                        content = b"".join([chunk async for chunk in self.iter_download(response)])
+                span.set(**{"http.response.status_code": response.status})
+            self.metrics.observe_request(endpoint, response.status, time.monotonic() - started_at)
+            return response.status, response.headers, content
+
+        _, content = await self.retry_policy.without_deadline().run(send, self.logger, f"download of {url}")
+        return content
+
+    async def find_recent_scan(self, url, max_age):
+        if self.submission_index:
+            scan_uuid = self.submission_index.get(url, max_age)
+            if scan_uuid:
+                return scan_uuid
+
+        escaped_url = url.replace("\\", "\\\\").replace('"', '\\"')
+        query = f'(task.url:"{escaped_url}" OR page.url:"{escaped_url}") AND date:>now-{int(max_age)}s'
+        body = await self.search(query)
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age)
+        for result in (body or {}).get("results", []):
+            task = result.get("task", {})
+            scanned_at = datetime.fromisoformat(task.get("time", "1970-01-01T00:00:00Z").replace("Z", "+00:00"))
+            if task.get("uuid") and scanned_at >= cutoff:
+                return task["uuid"]
+        return None
 
     async def submit_scan_request(self, url, private=False):
-        headers = {"Content-Type": "application/json", "API-Key": self.api_key}
+        if self.reuse_max_age:
+            scan_uuid = await self.find_recent_scan(url, self.reuse_max_age)
+            if scan_uuid:
+                self.logger.info("Reusing recent scan %s for %s instead of submitting a new one", scan_uuid, url)
+                return scan_uuid
+
+        headers = {"Content-Type": "application/json"}
         payload = {"url": url} if private else {"url": url, "public": "on"}
-        status, response = await self.execute("POST", f"{self.URLSCAN_API_URL}/scan/", headers, payload)
+        status, response = await self.execute("POST", f"{self.URLSCAN_API_URL}/scan/", headers, payload,
+                                            action="scan", private=private)
         if status == 429:
             self.logger.critical("UrlScan did not accept scan request for %s, reason: too many requests", url)
             return ""
-        body = json.loads(response)
-        if status >= 400:
-            self.logger.critical("UrlScan did not accept scan request for %s, reason: %s", url, body["description"])
+        body = self.parse_json(response)
+        if status >= 400 or not isinstance(body, dict):
+            reason = body.get("description") if isinstance(body, dict) else None
+            self.logger.critical("UrlScan did not accept scan request for %s, reason: %s", url,
+                                 reason or f"{status} response code")
             return ""
+        if self.submission_index:
+            self.submission_index.add(url, body["uuid"])
         return body["uuid"]
 
+    async def request_result(self, scan_uuid):
+        if self.result_cache:
+            cached = await self.result_cache.get(scan_uuid)
+            if cached is not None:
+                self.logger.debug("Using cached result for scan %s", scan_uuid)
+                self.store_report(scan_uuid, cached)
+                return 200, cached
+        status, response = await self.execute("GET", f"{self.URLSCAN_API_URL}/result/{scan_uuid}", action="result")
+        # Only finished scans are cached, their results never change
+        if status == 200 and self.result_cache:
+            await self.result_cache.put(scan_uuid, response)
+        if status == 200:
+            self.store_report(scan_uuid, response)
+        return status, response
+
+    def store_report(self, scan_uuid, content):
+        if self.report_store and self.report_store.ingest(scan_uuid, content):
+            self.logger.debug("Added scan %s to the local report store", scan_uuid)
+
     async def get_result_data(self, scan_uuid):
-        _, response = await self.execute("GET", f"{self.URLSCAN_API_URL}/result/{scan_uuid}")
-        body = json.loads(response)
-        return body
+        status, response = await self.request_result(scan_uuid)
+        if status != 200:
+            self.logger.critical("Could not retrieve scan %s, UrlScan responded with %d", scan_uuid, status)
+        body = self.parse_json(response)
+        return {} if body is None else body
+
+    async def check_result(self, scan_uuid, paths=None):
+        status, response = await self.request_result(scan_uuid)
+        if status != 200:
+            return status, None
+        if paths:
+            return status, fastjson.loads_projection(response, paths)
+        return status, fastjson.loads(response)
 
     async def fetch_result(self, scan_uuid):
-        body = await self.get_result_data(scan_uuid)
+        with self.tracer.span("retrieve", scan_uuid=str(scan_uuid)):
+            _, response = await self.request_result(scan_uuid)
+            body = fastjson.loads_projection(response, self.TASK_FIELDS)
+            return await self.download_artifacts(scan_uuid, body)
+
+    async def download_artifacts(self, scan_uuid, body):
+        screenshot, dom = await asyncio.gather(
+            self.download_screenshot(body["task"]["screenshotURL"]),
+            self.download_dom(scan_uuid, body["task"]["domURL"])
+        )
         return {
             "scan_uuid": scan_uuid,
             "report": body["task"]["reportURL"],
-            "screenshot": await self.download_screenshot(body["task"]["screenshotURL"]),
-            "dom": await self.download_dom(scan_uuid, body["task"]["domURL"])
+            "screenshot": screenshot,
+            "dom": dom
         }
 
     async def download_screenshot(self, screenshot_url):
         self.logger.info("Downloading screenshot from %s", screenshot_url)
         screenshot_name = screenshot_url.split("/")[-1]
         screenshot_location = Path(f"{self.data_dir}/screenshots/{screenshot_name}")
-        status, response = await self.execute("GET", screenshot_url)
-        if status == 200:
-            await self.save_file(screenshot_location, response)
-            return str(screenshot_location)
+        location = await self.download(screenshot_url, screenshot_location)
+        if location:
+            return str(location)
         self.logger.info("Could not download screenshot from %s, please visit URL for more info", screenshot_url)
 
     async def download_dom(self, scan_uuid, dom_url):
         self.logger.info("Downloading DOM from %s", dom_url)
         dom_location = Path(f"{self.data_dir}/doms/{scan_uuid}.txt")
-        status, response = await self.execute("GET", dom_url)
-        if status == 200:
-            await self.save_file(dom_location, response)
-            return str(dom_location)
+        location = await self.download(dom_url, dom_location)
+        if location:
+            return str(location)
         self.logger.info("Could not download DOM from %s, please visit URL for more info", dom_url)
 
-    async def investigate(self, url, private=False):
+    def record_scan_latency(self, latency):
+        # Exponentially weighted so the estimate follows urlscan's current load
+        self.scan_latency = 0.8 * self.scan_latency + 0.2 * latency
+
+    def first_poll_delay(self):
+        # Aim slightly early, a missed first poll is cheaper than waiting longer than needed
+        return max(self.DEFAULT_PAUSE_TIME, 0.8 * self.scan_latency)
+
+    def next_poll_delay(self, attempt):
+        delay = min(self.DEFAULT_PAUSE_TIME * self.POLL_BACKOFF_FACTOR ** attempt, self.MAX_PAUSE_TIME)
+        return delay * random.uniform(1 - self.POLL_JITTER, 1 + self.POLL_JITTER)
+
+    async def submit_investigation(self, url, private=False, scan_uuid=None, journal=None):
         self.logger.critical("Starting investigation of %s, this may take a while...", url)
-        self.logger.debug("Default sleep time between attempts: %d, maximum number of attempts: %d",
-                          self.DEFAULT_PAUSE_TIME, self.DEFAULT_MAX_ATTEMPTS)
+        # Only ended by download_investigation, as the stages of a batch run an investigation in different tasks
+        span = self.tracer.start("investigate", self.tracer.current.get(), url=url)
+
+        if scan_uuid:
+            self.logger.info("Reusing scan %s previously submitted for %s", scan_uuid, url)
+            span.set(scan_uuid=str(scan_uuid))
+            return {"url": url, "scan_uuid": scan_uuid, "submitted_at": None, "span": span}
 
         self.logger.info("Requesting scan for %s", url)
-        scan_uuid = await self.submit_scan_request(url, private)
+        with self.tracer.activate(span), self.tracer.span("submit"):
+            scan_uuid = await self.submit_scan_request(url, private)
         if scan_uuid == "":
             self.logger.critical("Failed to submit scan request for %s, cannot investigate", url)
-            return {}
+            return {"url": url, "result": {}, "span": span}
+        span.set(scan_uuid=scan_uuid)
+        if journal:
+            journal.record(url, journal.SUBMITTED, scan_uuid=scan_uuid)
+        return {"url": url, "scan_uuid": scan_uuid, "submitted_at": time.monotonic(), "span": span}
+
+    async def poll_investigation(self, investigation, journal=None, fields=TASK_FIELDS):
+        if "result" in investigation:
+            return investigation
+        with self.tracer.activate(investigation.get("span")), self.tracer.span("poll"):
+            return await self.wait_for_result(investigation, journal, fields)
 
+    async def wait_for_result(self, investigation, journal, fields):
+        url, scan_uuid, submitted_at = investigation["url"], investigation["scan_uuid"], investigation["submitted_at"]
+
+        if submitted_at is None:
+            delay = self.DEFAULT_PAUSE_TIME
+        else:
+            # Time spent waiting for a free poller already counts towards the first delay
+            delay = max(self.first_poll_delay() - (time.monotonic() - submitted_at), 0)
         self.logger.info("Request submitted for %s, attempting to retrieve scan %s", url, scan_uuid)
+        self.logger.debug("First poll in %.1fs, maximum number of attempts: %d", delay, self.DEFAULT_MAX_ATTEMPTS)
 
         attempts = 0
-        await asyncio.sleep(self.DEFAULT_PAUSE_TIME)
         while attempts < self.DEFAULT_MAX_ATTEMPTS:
+            with self.tracer.span("poll wait", attempt=attempts + 1):
+                await asyncio.sleep(delay)
             self.logger.debug("Retrieving %s scan results %s, attempt #%d", url, scan_uuid, attempts)
+            status, body = await self.check_result(scan_uuid, fields)
+            if status == 200:
+                break
+            if status not in self.RETRYABLE_POLL_STATUSES:
+                self.logger.critical("Stopped polling scan %s for %s, UrlScan responded with %d",
+                                     scan_uuid, url, status)
+                self.metrics.observe_poll(attempts + 1)
+                return {**investigation, "result": {"scan_uuid": scan_uuid}}
+            delay = self.next_poll_delay(attempts)
+            attempts += 1
+        else:
+            self.logger.critical(
+                "Couldn't fetch report after %d tries. Please wait a few seconds and visit "
+                "https://urlscan.io/result/%s/.", attempts, scan_uuid
+            )
+            self.metrics.observe_poll(attempts)
+            return {**investigation, "result": {"scan_uuid": scan_uuid}}
+
+        if submitted_at is not None:
+            self.record_scan_latency(time.monotonic() - submitted_at)
+            self.metrics.observe_poll(attempts + 1, time.monotonic() - submitted_at)
+        else:
+            self.metrics.observe_poll(attempts + 1)
+        if journal:
+            journal.record(url, journal.FETCHED, scan_uuid=scan_uuid, report=body["task"]["reportURL"])
+        return {**investigation, "body": body}
+
+    async def download_investigation(self, investigation, journal=None):
+        span = investigation.get("span")
+        try:
+            if "result" in investigation:
+                return investigation
+            with self.tracer.activate(span), self.tracer.span("download"):
+                result = await self.download_artifacts(investigation["scan_uuid"], investigation["body"])
+            if journal:
+                journal.record(investigation["url"], journal.DOWNLOADED, **result)
+            return {**investigation, "result": result}
+        finally:
+            self.tracer.end(span)
+
+    async def investigate(self, url, private=False, scan_uuid=None, journal=None):
+        investigation = await self.submit_investigation(url, private, scan_uuid, journal)
+        try:
+            investigation = await self.poll_investigation(investigation, journal)
+            investigation = await self.download_investigation(investigation, journal)
+        finally:
+            self.tracer.end(investigation["span"])
+        return investigation["result"]
+
+    async def read_lines(self, input_file):
+        if input_file == "-":
+            loop = asyncio.get_running_loop()
+            while True:
+                line = await loop.run_in_executor(None, sys.stdin.readline)
+                if not line:
+                    return
+                yield line.rstrip()
+        else:
+            async with aiofiles.open(input_file, "r") as input_data:
+                async for line in input_data:
+                    yield line.rstrip()
+
+    @staticmethod
+    async def run_pipeline(items, stages):
+        # Stages are (handle, workers) pairs, and whatever a handler returns other than None goes on to the next
+        # stage. Each queue holds at most as many items as its stage has workers, so a slow stage holds back the
+        # ones before it instead of letting work pile up in front of it.
+        queues = [asyncio.Queue(maxsize=workers) for _, workers in stages]
+
+        async def produce():
+            async for item in items:
+                await queues[0].put(item)
+
+        async def close(index, upstream):
+            await upstream
+            for _ in range(stages[index][1]):
+                await queues[index].put(None)
+
+        async def work(index):
+            handle = stages[index][0]
+            while (item := await queues[index].get()) is not None:
+                result = await handle(item)
+                if result is not None and index + 1 < len(stages):
+                    await queues[index + 1].put(result)
+
+        upstream = produce()
+        for index, (_, workers) in enumerate(stages):
+            upstream = asyncio.gather(close(index, upstream), *[work(index) for _ in range(workers)])
+        await upstream
+
+    @classmethod
+    async def run_workers(cls, items, handle, workers):
+        await cls.run_pipeline(items, [(handle, workers)])
+
+    @staticmethod
+    def batch_row(url, result):
+        report_url = result.get("report")
+        if not report_url:
+            scan_uuid = result.get("scan_uuid")
+            if scan_uuid:
+                report_url = f"https://urlscan.io/result/{scan_uuid}/"
+        outcome = "success" if result.get("report") else "failure"
+        return [url, report_url, result.get("screenshot"), result.get("dom"), outcome]
+
+    @staticmethod
+    def canonical_url(line):
+        try:
+            url = utils.normalize_url(line)
+        except ValueError:
+            return None
+        return url if utils.is_url_valid(url) else None
+
+    async def batch_investigate(self, urls_file, private=False, workers=DEFAULT_WORKERS, output_path=None,
+                                resume=False, stage_workers=None):
+        output_path = Path(output_path or utils.get_batch_output_path(urls_file))
+        with BatchInvestigation(self, output_path, private, resume) as batch:
+            await batch.run(urls_file, workers, stage_workers)
+        return output_path
+
+    async def read_uuids(self, uuids_file):
+        async for line in self.read_lines(uuids_file):
+            scan_uuid = line.strip()
+            if not scan_uuid:
+                continue
+            if not utils.is_uuid_valid(scan_uuid):
+                self.logger.critical("Skipping %s, it is not a valid scan UUID", scan_uuid)
+                continue
+            yield scan_uuid
+
+    async def retrieve_record(self, scan_uuid, reports=False, extractor=None):
+        with self.tracer.span("retrieve", scan_uuid=scan_uuid):
+            status, body = await self.check_result(scan_uuid, None if reports else self.TASK_FIELDS)
+            if status != 200:
+                self.logger.critical("Could not retrieve scan %s, UrlScan responded with %d", scan_uuid, status)
+                return {"scan_uuid": scan_uuid, "status": status}
+            if reports and extractor:
+                # The extracted records are what is kept, so only their counts are written out
+                return {"scan_uuid": scan_uuid, "records": extractor.add(scan_uuid, body)}
+            if reports:
+                return body
+            return await self.download_artifacts(scan_uuid, body)
+
+    async def batch_retrieve(self, uuids_file, output_file, workers=DEFAULT_WORKERS, reports=False,
+                             output_format="ndjson", extractor=None):
+        if output_format == "csv":
+            output = csv.writer(output_file)
+            output.writerow(["scan_uuid", "report", "screenshot", "dom", "outcome"])
+            output_file.flush()
+
+        async def handle(scan_uuid):
             try:
-                return await self.fetch_result(scan_uuid)
-            except KeyError:
-                attempts += 1
-                await asyncio.sleep(self.DEFAULT_PAUSE_TIME)
-
-        self.logger.critical(
-            "Couldn't fetch report after %d tries. Please wait a few seconds and visit https://urlscan.io/result/%s/.",
-            attempts, scan_uuid
-        )
-        return {
-            "scan_uuid": scan_uuid
-        }
+                record = await self.retrieve_record(scan_uuid, reports, extractor)
+            except RetryPolicy.RETRYABLE_ERRORS as error:
+                self.logger.critical("Could not retrieve scan %s: %r", scan_uuid, error)
+                record = {"scan_uuid": scan_uuid, "error": repr(error)}
+
+            if output_format == "csv":
+                output.writerow(self.batch_row(scan_uuid, record))
+            else:
+                output_file.write(fastjson.dumps(record) + "\n")
+            output_file.flush()
 
-    async def batch_investigate(self, urls_file, private=False):
-        output_file = open(f"{Path(urls_file).stem}.csv", "w")
-        output = csv.writer(output_file)
-        output.writerow(["url", "report", "screenshot", "dom"])
-
-        async with aiofiles.open(urls_file, "r") as urls_data:
-            coros = []
-            urls = []
-            async for url in urls_data:
-                url = url.rstrip()
-                urls.append(url)
-                coros.append(asyncio.gather(self.investigate(url, private)))
-                await asyncio.sleep(3)
-            all_results = await asyncio.gather(*coros)
-
-            for i, result in enumerate(all_results):
-                result = result[0]
-
-                report_url = result.get("report")
-                if not report_url:
-                    scan_uuid = result.get("scan_uuid")
-                    if scan_uuid:
-                        report_url = f"https://urlscan.io/result/{scan_uuid}/"
-                output.writerow([urls[i].rstrip(), report_url, result.get("screenshot"), result.get("dom")])
-
-            output_file.close()
-
-    async def search(self, query: str):
-        headers = {"API-Key": self.api_key}
+        await self.run_workers(self.read_uuids(uuids_file), handle, workers)
+
+    async def search(self, query: str, size=None, search_after=None):
         params = {"q": query}
-        status, response = await self.execute("GET", f"{self.URLSCAN_API_URL}/search/", headers, params=params)
+        if size:
+            params["size"] = size
+        if search_after:
+            params["search_after"] = search_after
+        status, response = await self.execute("GET", f"{self.URLSCAN_API_URL}/search/", params=params,
+                                            action="search")
         if status == 429:
             self.logger.critical("UrlScan did not accept scan request for %s, reason: too many requests", query)
             return ""
-        body = json.loads(response)
-        if status >= 400:
-            self.logger.critical("UrlScan did not accept scan request for %s, reason: %s", query, body["message"])
+        body = self.parse_json(response)
+        if status >= 400 or not isinstance(body, dict):
+            reason = body.get("message") if isinstance(body, dict) else None
+            self.logger.critical("UrlScan did not accept scan request for %s, reason: %s", query,
+                                 reason or f"{status} response code")
             return ""
         return body
+
+    async def iter_search(self, query: str, limit=None, size=DEFAULT_SEARCH_PAGE_SIZE):
+        fetched = 0
+        next_page = asyncio.ensure_future(self.search(query, size))
+        try:
+            while next_page:
+                body = await next_page
+                next_page = None
+                results = body.get("results", []) if body else []
+                if limit is not None:
+                    results = results[:limit - fetched]
+
+                # Request the following page now so that it downloads while this one is consumed
+                if results and body.get("has_more") and (limit is None or fetched + len(results) < limit):
+                    search_after = ",".join(str(value) for value in results[-1]["sort"])
+                    next_page = asyncio.ensure_future(self.search(query, size, search_after))
+
+                for result in results:
+                    yield result
+                    fetched += 1
+        finally:
+            if next_page:
+                next_page.cancel()
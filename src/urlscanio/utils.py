@@ -1,9 +1,35 @@
 import argparse
 import logging
+import os
 import pathlib
 import re
 import urllib.parse
 
+def parse_stage_workers(value):
+    try:
+        stage_workers = tuple(int(workers) for workers in value.split(","))
+    except ValueError:
+        stage_workers = ()
+    if len(stage_workers) != 3:
+        raise argparse.ArgumentTypeError("expected three numbers of workers, eg 2,50,10")
+    return stage_workers
+
+
+INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_interval(value):
+    # A number of seconds, optionally followed by a unit, eg 90, 30m or 12h
+    unit = INTERVAL_UNITS.get(value[-1:].lower())
+    try:
+        seconds = float(value[:-1] if unit else value) * (unit or 1)
+    except ValueError:
+        seconds = 0
+    if seconds <= 0:
+        raise argparse.ArgumentTypeError(f"expected a positive interval such as 90, 30m or 12h, got {value}")
+    return seconds
+
+
 def create_arg_parser():
     parser = argparse.ArgumentParser(
         prog="urlscan",
@@ -29,6 +55,234 @@ def create_arg_parser():
         type=int
     )
 
+    parser.add_argument(
+        "-w", "--workers",
+        help=(
+            "Number of URLs or UUIDs processed concurrently when using --batch-investigate, "
+            "--batch-retrieve, or --batch-get-report. Defaults to 5."
+        ),
+        default=5, type=int
+    )
+
+    parser.add_argument(
+        "--stage-workers",
+        help=(
+            "With --batch-investigate, run submissions, result polling and artifact downloads as "
+            "separate stages with their own number of workers, given as SUBMIT,POLL,DOWNLOAD, eg "
+            "2,50,10. Polling workers spend most of their time waiting for scans to finish, so they "
+            "should be the most numerous. Replaces -w/--workers."
+        ),
+        type=parse_stage_workers
+    )
+
+    parser.add_argument(
+        "--resume",
+        help=(
+            "Resume a previous --batch-investigate run using the journal written next to its "
+            "output CSV. Scans which were already submitted are reused, including those which could not be fetched, "
+            "and URLs which succeeded or failed before a scan was submitted are skipped."
+        ),
+        action="store_true"
+    )
+
+    parser.add_argument(
+        "--watch-interval",
+        help=(
+            "With --watch, how long to wait between two scans of a URL whose line in the watch list "
+            "does not set its own interval, eg 90, 30m, 12h or 1d. Defaults to 1h."
+        ),
+        default=3600, type=parse_interval
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        help=(
+            "Maximum size in MB of the local cache of finished scan results, kept in a cache "
+            "directory inside URLSCAN_DATA_DIR. Least recently used results are evicted first. "
+            "Set to 0 to disable the cache. Defaults to 256."
+        ),
+        default=256, type=int
+    )
+
+    parser.add_argument(
+        "--reuse-max-age",
+        help=(
+            "Before submitting a scan, look for a scan of the same URL made in the last "
+            "REUSE_MAX_AGE seconds, either by you or found through UrlScan.io's search API, "
+            "and reuse it instead of submitting a new one."
+        ),
+        type=int
+    )
+
+    parser.add_argument(
+        "--connections",
+        help="Maximum number of simultaneous connections. Defaults to 100.",
+        default=100, type=int
+    )
+
+    parser.add_argument(
+        "--connections-per-host",
+        help="Maximum number of simultaneous connections to a single host. Defaults to 20.",
+        default=20, type=int
+    )
+
+    parser.add_argument(
+        "--connect-timeout",
+        help="Number of seconds to wait for a connection to be established. Defaults to 10.",
+        default=10, type=float
+    )
+
+    parser.add_argument(
+        "--read-timeout",
+        help="Number of seconds to wait for data on an open connection. Defaults to 60.",
+        default=60, type=float
+    )
+
+    parser.add_argument(
+        "--uvloop",
+        help="Use uvloop as the event loop, if it is installed.",
+        action="store_true"
+    )
+
+    parser.add_argument(
+        "--ndjson",
+        help=(
+            "With -q/--search-query, follow every page of results and print each result as "
+            "a single line of JSON as soon as it is received."
+        ),
+        action="store_true"
+    )
+
+    parser.add_argument(
+        "--output-format",
+        help="Output format used by --batch-retrieve and --batch-get-report. Defaults to ndjson.",
+        choices=["ndjson", "csv"], default="ndjson"
+    )
+
+    parser.add_argument(
+        "--limit",
+        help="With --ndjson or --search-local, stop after this many search results.",
+        type=int
+    )
+
+    parser.add_argument(
+        "--artifact-store",
+        help=(
+            "Store screenshots and DOMs compressed and deduplicated by content in a store directory "
+            "inside URLSCAN_DATA_DIR, instead of the screenshots and doms directories. zstd requires "
+            "the zstandard package to be installed."
+        ),
+        choices=["gzip", "zstd"]
+    )
+
+    parser.add_argument(
+        "--force",
+        help=(
+            "Download screenshots and DOMs again even if a complete copy is already in URLSCAN_DATA_DIR "
+            "or in the artifact store."
+        ),
+        action="store_true"
+    )
+
+    parser.add_argument(
+        "--report-store",
+        help=(
+            "Index the key fields of every scan result retrieved, such as domains, IPs, ASNs, hashes, "
+            "page titles and verdicts, in reports.sqlite inside URLSCAN_DATA_DIR, to be searched "
+            "offline with --search-local."
+        ),
+        action="store_true"
+    )
+
+    parser.add_argument(
+        "--extract",
+        help=(
+            "With --batch-get-report, flatten sections of each scan report into typed records, "
+            "written in batches to one table per section in this directory, instead of writing "
+            "the reports to stdout."
+        ),
+        type=str
+    )
+
+    parser.add_argument(
+        "--extract-format",
+        help="Format of the records written by --extract. parquet requires pyarrow. Defaults to ndjson.",
+        choices=["ndjson", "sqlite", "parquet"], default="ndjson"
+    )
+
+    parser.add_argument(
+        "--sections",
+        help=(
+            "Comma separated report sections extracted by --extract, among page, requests, domains, "
+            "ips and certificates. Defaults to all of them."
+        ),
+        type=str
+    )
+
+    parser.add_argument(
+        "--metrics-json",
+        help=(
+            "Write a JSON summary of API latencies, response codes, polling attempts, time to "
+            "result, bytes downloaded and remaining rate limit to this file at the end of the run."
+        ),
+        type=str
+    )
+
+    parser.add_argument(
+        "--metrics-prometheus",
+        help="Write the same metrics to this file in the Prometheus textfile format at the end of the run.",
+        type=str
+    )
+
+    parser.add_argument(
+        "--trace",
+        help=(
+            "Record how long every phase of each investigation or retrieval took, such as waiting for "
+            "the rate limiter, submitting, polling and downloading, and every HTTP call to UrlScan.io, "
+            "tagged with the URL and scan UUID, and write them to this file at the end of the run. Not "
+            "available with --watch and --serve, which run until they are interrupted."
+        ),
+        type=str
+    )
+
+    parser.add_argument(
+        "--trace-format",
+        help=(
+            "Format of the file written by --trace: chrome, the Chrome trace event format read by "
+            "Perfetto and chrome://tracing, or otlp, OpenTelemetry's OTLP JSON. Defaults to chrome."
+        ),
+        choices=["chrome", "otlp"], default="chrome"
+    )
+
+    parser.add_argument(
+        "--max-attempts",
+        help=(
+            "Maximum number of attempts for each API call. Calls which are rate limited, fail "
+            "with a 5xx response code or a connection error are retried. Defaults to 5."
+        ),
+        default=5, type=int
+    )
+
+    parser.add_argument(
+        "--request-deadline",
+        help=(
+            "Number of seconds after which an API call and its retries are abandoned, not counting time spent "
+            "waiting for rate limits. Screenshot and DOM downloads are only bounded by --read-timeout. "
+            "Defaults to 300."
+        ),
+        default=300, type=float
+    )
+
+    parser.add_argument(
+        "--server",
+        help=(
+            "Send the investigation, retrieval, submission, search or report request to a urlscanio "
+            "service started with --serve at this address, instead of calling UrlScan.io directly. "
+            "Defaults to the URLSCAN_SERVER environment variable, if set, for those requests."
+        ),
+        type=str
+    )
+
     parser.add_argument(
         "-p", "--private",
         help=("Submit the URL in private. Private searches are not shared with other users."),
@@ -39,12 +293,23 @@ def create_arg_parser():
     group.add_argument(
         "-b", "--batch-investigate",
         help=(
-            "Investigates the URLs included in the specified file. Returns an output CSV "
-            "containing report, DOM, and screenshot locations for each URL. Please keep "
+            "Investigates the URLs included in the specified file, or read from stdin if "
+            "the file is '-'. Writes an output CSV containing report, DOM, and screenshot "
+            "locations for each URL as soon as its investigation finishes. Please keep "
             "your UrlScan.io rate limit in mind when running this."
         ),
         type=str
     )
+    group.add_argument(
+        "--watch",
+        help=(
+            "Rescan the URLs included in the specified file until interrupted, each line holding a "
+            "URL optionally followed by its own interval, eg 'https://example.com 30m'. A URL's "
+            "screenshot and DOM are only kept, and an event only written to stdout as a single line "
+            "of JSON, when its DOM or key fields of its report changed since its previous scan."
+        ),
+        type=str
+    )
     group.add_argument(
         "-i", "--investigate",
         help=(
@@ -77,10 +342,55 @@ def create_arg_parser():
             "Get the scan report for the provided UUID, in JSON format."
         )
     )
+    group.add_argument(
+        "--batch-retrieve",
+        help=(
+            "Retrieves the scan reports for the UUIDs included in the specified file, or read "
+            "from stdin if the file is '-'. Writes the report URL and the download locations for "
+            "the DOM and screenshot of each scan to stdout as soon as they are retrieved."
+        ),
+        type=str
+    )
+    group.add_argument(
+        "--batch-get-report",
+        help=(
+            "Get the scan reports for the UUIDs included in the specified file, or read from stdin "
+            "if the file is '-'. Writes each report to stdout as a single line of JSON."
+        ),
+        type=str
+    )
+    group.add_argument(
+        "--search-local",
+        help=(
+            "Search the scan results indexed with --report-store, without calling UrlScan.io. Takes "
+            "an SQLite full-text query, eg 'domains:\"example.com\" AND verdicts:malicious'. Returns "
+            "at most 100 results, or --limit."
+        ),
+        type=str
+    )
+    group.add_argument(
+        "--serve",
+        help=(
+            "Run as a long-lived service accepting investigation, retrieval, submission, search and "
+            "report requests from clients using --server. Listens on unix:/path/to/socket or "
+            "[host]:port, sharing one connection pool, rate limiter and result cache between all of "
+            "them. At most --workers requests are run at the same time."
+        ),
+        type=str
+    )
 
     return parser
 
 
+UUID_VALIDATOR = re.compile(
+    "^[a-f0-9]{8}-[a-f0-9]{4}-4[a-f0-9]{3}-[89ab][a-f0-9]{3}-[a-f0-9]{12}$"
+)
+
+
+def is_uuid_valid(scan_uuid):
+    return bool(UUID_VALIDATOR.match(scan_uuid))
+
+
 def is_url_valid(url):
     minimum_url_attributes = ["scheme", "netloc"]
     token = urllib.parse.urlparse(url)
@@ -88,19 +398,92 @@ def is_url_valid(url):
            len([s for s in token.netloc.split(".") if s != ""]) > 1
 
 
-def validate_arguments(args):
-    uuid_validator = re.compile(
-        "^[a-f0-9]{8}-[a-f0-9]{4}-4[a-f0-9]{3}-[89ab][a-f0-9]{3}-[a-f0-9]{12}$"
-    )
+def is_address_valid(address):
+    if address.startswith("unix:"):
+        return len(address) > len("unix:")
+    _, separator, port = address.rpartition(":")
+    return bool(separator) and port.isdigit() and int(port) < 65536
+
 
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url):
+    # Raises ValueError for URLs which cannot be parsed, eg because of an invalid port
+    token = urllib.parse.urlsplit(url.strip())
+    scheme = token.scheme.lower()
+    netloc = (token.hostname or "").rstrip(".")
+    if ":" in netloc:
+        netloc = f"[{netloc}]"
+    if token.port is not None and token.port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{token.port}"
+    if token.username is not None:
+        userinfo = token.username if token.password is None else f"{token.username}:{token.password}"
+        netloc = f"{userinfo}@{netloc}"
+    return urllib.parse.urlunsplit((scheme, netloc, token.path.rstrip("/"), token.query, ""))
+
+
+def validate_arguments(args):
     if (args.investigate and not is_url_valid(args.investigate)) or \
        (args.submit and not is_url_valid(args.submit)):
         raise ValueError(
             "The URL provided does not contain the scheme (e.g. http:// or https://) "
             "and/or a non-empty location (e.g. google.com)"
         )
-    elif args.retrieve and not bool(uuid_validator.match(args.retrieve)):
+    elif args.retrieve and not is_uuid_valid(args.retrieve):
         raise ValueError("The UUID provided is incorrectly formatted")
+    elif args.workers < 1 or (args.stage_workers and min(args.stage_workers) < 1):
+        raise ValueError("The number of workers must be at least 1")
+    elif args.cache_size < 0:
+        raise ValueError("The cache size cannot be negative")
+    elif args.max_attempts < 1:
+        raise ValueError("The maximum number of attempts must be at least 1")
+    elif args.request_deadline <= 0:
+        raise ValueError("The request deadline must be a positive number of seconds")
+    elif args.connections < 1 or args.connections_per_host < 1:
+        raise ValueError("The number of connections must be at least 1")
+    elif args.connect_timeout <= 0 or args.read_timeout <= 0:
+        raise ValueError("Timeouts must be a positive number of seconds")
+    elif (args.extract or args.sections) and not args.batch_get_report:
+        raise ValueError("Reports can only be extracted with --batch-get-report")
+    elif args.batch_get_report and args.output_format == "csv":
+        raise ValueError("Scan reports can only be written as NDJSON")
+    elif args.limit is not None and args.limit < 1:
+        raise ValueError("The limit must be at least 1")
+    elif args.reuse_max_age is not None and args.reuse_max_age <= 0:
+        raise ValueError("The maximum age of reused scans must be a positive number of seconds")
+    elif (args.serve and not is_address_valid(args.serve)) or (args.server and not is_address_valid(args.server)):
+        raise ValueError("Service addresses must be either unix:/path/to/socket or [host]:port")
+    elif args.trace and (args.server or args.search_local):
+        raise ValueError("Traces are only recorded by the process calling UrlScan.io")
+    elif args.trace and (args.watch or args.serve):
+        raise ValueError("Traces are kept in memory until the run ends, so --watch and --serve cannot record them")
+    elif args.search_local and args.server:
+        raise ValueError("Local searches are answered from the local report store, not by a service")
+    elif args.server and (args.serve or args.batch_investigate or args.batch_retrieve or args.batch_get_report or
+                          args.watch):
+        raise ValueError("Batches cannot be sent to a service, and a service cannot be started with --server")
+
+
+# Requests a service can run, the only ones sent to the URLSCAN_SERVER service when --server is not given
+SERVICE_REQUESTS = ("investigate", "retrieve", "submit", "search_query", "get_report")
+
+
+def service_address(args):
+    if args.server:
+        return args.server
+    if not any(getattr(args, request) for request in SERVICE_REQUESTS) or args.trace:
+        return None
+    address = os.getenv("URLSCAN_SERVER")
+    if address and not is_address_valid(address):
+        raise ValueError("URLSCAN_SERVER must be either unix:/path/to/socket or [host]:port")
+    return address
+
+
+def get_batch_output_path(urls_file):
+    if urls_file == "-":
+        return pathlib.Path("stdin.csv")
+    return pathlib.Path(f"{pathlib.Path(urls_file).stem}.csv")
 
 
 def create_data_dir(data_dir):
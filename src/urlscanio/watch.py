@@ -0,0 +1,178 @@
+import argparse
+import asyncio
+import hashlib
+import heapq
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import fastjson, utils
+from .extract import dig
+from .journal import Journal
+from .retry import RetryPolicy
+
+
+class Watcher:
+    # Report fields compared between two scans of a URL, on top of the hash of its DOM
+    KEY_FIELDS = (
+        "page.url", "page.domain", "page.ip", "page.asn", "page.country", "page.server", "page.status",
+        "page.mimeType", "page.title", "verdicts.overall.malicious", "verdicts.overall.score",
+        "verdicts.overall.categories", "verdicts.overall.brands"
+    )
+    NEW = "new"
+    CHANGED = "changed"
+
+    def __init__(self, url_scan, state_path, events=sys.stdout, interval=3600, private=False):
+        self.url_scan = url_scan
+        self.logger = url_scan.logger
+        self.state_path = Path(state_path)
+        self.events = events
+        self.interval = interval
+        self.private = private
+        self.previous = {}
+        # Next check of every URL which is not being checked, as (due at, URL) pairs
+        self.schedule = []
+        self.rescheduled = asyncio.Event()
+
+    async def read_watch_list(self, watch_file):
+        targets = {}
+        line_number = 0
+        async for line in self.url_scan.read_lines(watch_file):
+            line_number += 1
+            fields = line.split()
+            if not fields:
+                continue
+            url = self.url_scan.canonical_url(fields[0])
+            try:
+                interval = utils.parse_interval(fields[1]) if len(fields) > 1 else self.interval
+            except argparse.ArgumentTypeError:
+                interval = None
+            if url is None or interval is None or len(fields) > 2:
+                self.logger.critical("Skipping line %d, expected a URL optionally followed by an interval: %s",
+                                     line_number, line)
+                continue
+            targets[url] = interval
+        return targets
+
+    @classmethod
+    def snapshot(cls, body, dom):
+        return {
+            "dom_sha256": hashlib.sha256(dom).hexdigest(),
+            "fields": {path: dig(body, *path.split(".")) for path in cls.KEY_FIELDS}
+        }
+
+    @staticmethod
+    def compare(previous, snapshot):
+        changes = {}
+        if previous["dom_sha256"] != snapshot["dom_sha256"]:
+            changes["dom_sha256"] = {"previous": previous["dom_sha256"], "current": snapshot["dom_sha256"]}
+        for path, value in snapshot["fields"].items():
+            if previous["fields"].get(path) != value:
+                changes[path] = {"previous": previous["fields"].get(path), "current": value}
+        return changes
+
+    def emit(self, event):
+        self.events.write(fastjson.dumps(event) + "\n")
+        self.events.flush()
+
+    async def check(self, url, journal):
+        investigation = await self.url_scan.submit_investigation(url, self.private)
+        try:
+            with self.url_scan.tracer.activate(investigation["span"]):
+                return await self.compare_scan(url, investigation, journal)
+        finally:
+            self.url_scan.tracer.end(investigation["span"])
+
+    async def compare_scan(self, url, investigation, journal):
+        investigation = await self.url_scan.poll_investigation(investigation,
+                                                               fields=(*self.url_scan.TASK_FIELDS, *self.KEY_FIELDS))
+        if "result" in investigation:
+            self.logger.critical("Could not rescan %s, it will be scanned again in its next interval", url)
+            return None
+        scan_uuid, body = investigation["scan_uuid"], investigation["body"]
+        dom = await self.url_scan.fetch_artifact(body["task"]["domURL"], "doms")
+        if dom is None:
+            self.logger.critical("Could not download the DOM of scan %s for %s", scan_uuid, url)
+            return None
+
+        snapshot = self.snapshot(body, dom)
+        previous = self.previous.get(url)
+        changes = {} if previous is None else self.compare(previous, snapshot)
+        checked_at = datetime.now(timezone.utc).isoformat()
+        event = None
+        if previous is None or changes:
+            # Artifacts of scans which found nothing new are never written, so storage follows the changes
+            dom_location, screenshot = await asyncio.gather(
+                self.url_scan.save_artifact(f"{self.url_scan.data_dir}/doms/{scan_uuid}.txt", dom),
+                self.url_scan.download_screenshot(body["task"]["screenshotURL"])
+            )
+            event = {
+                "event": self.NEW if previous is None else self.CHANGED,
+                "url": url,
+                "scan_uuid": scan_uuid,
+                "previous_scan_uuid": None if previous is None else previous["scan_uuid"],
+                "checked_at": checked_at,
+                "report": body["task"]["reportURL"],
+                "screenshot": screenshot,
+                "dom": str(dom_location),
+                "changes": changes
+            }
+            self.emit(event)
+        else:
+            self.logger.info("No change found by scan %s of %s", scan_uuid, url)
+
+        self.previous[url] = {"scan_uuid": scan_uuid, "checked_at": checked_at, **snapshot}
+        journal.record(url, journal.CHECKED, scan_uuid=scan_uuid, checked_at=checked_at, **snapshot)
+        return event
+
+    def first_check(self, url, interval):
+        # A restarted watch carries on with the schedule of the previous one instead of rescanning everything
+        checked_at = self.previous.get(url, {}).get("checked_at")
+        if checked_at is None:
+            return time.time()
+        return datetime.fromisoformat(checked_at).timestamp() + interval
+
+    def reschedule(self, url, due_at):
+        heapq.heappush(self.schedule, (due_at, url))
+        self.rescheduled.set()
+
+    async def due_urls(self):
+        while True:
+            self.rescheduled.clear()
+            if not self.schedule:
+                await self.rescheduled.wait()
+                continue
+            due_at, url = self.schedule[0]
+            delay = due_at - time.time()
+            if delay > 0:
+                # A URL rescheduled in the meantime may be due before this one
+                try:
+                    await asyncio.wait_for(self.rescheduled.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.schedule)
+            yield url
+
+    async def watch(self, watch_file, workers):
+        targets = await self.read_watch_list(watch_file)
+        if not targets:
+            self.logger.critical("No valid URL to watch in %s", watch_file)
+            return
+        with Journal(self.state_path, resume=True) as journal:
+            self.previous = {url: entry for url, entry in journal.entries.items()
+                             if entry.get("state") == journal.CHECKED}
+            for url, interval in targets.items():
+                self.reschedule(url, self.first_check(url, interval))
+            self.logger.critical("Watching %d URLs", len(targets))
+
+            async def handle(url):
+                try:
+                    await self.check(url, journal)
+                except RetryPolicy.RETRYABLE_ERRORS as error:
+                    # A URL which keeps failing must not stop the others from being watched
+                    self.logger.critical("Check of %s failed: %r", url, error)
+                self.reschedule(url, time.time() + targets[url])
+
+            await self.url_scan.run_workers(self.due_urls(), handle, workers)
@@ -0,0 +1,85 @@
+import pytest
+
+from ..context import batch, urlscan
+
+TEST_UUID = "e2963e73-74e2-46d0-b9d4-db7db9d6b79d"
+
+
+async def collect(items):
+    return [item async for item in items]
+
+
+@pytest.mark.asyncio
+async def test_read_urls_only_yields_new_urls(tmp_path):
+    urls_file = tmp_path.joinpath("urls.txt")
+    urls_file.write_text("https://www.test.com\nnot a url\n\nHTTPS://WWW.TEST.COM/\nhttps://www.other.com\n")
+    output_path = tmp_path.joinpath("urls.csv")
+
+    async with urlscan.UrlScan(api_key="some-api-key", data_dir=tmp_path) as url_scan:
+        with batch.BatchInvestigation(url_scan, output_path) as investigation:
+            urls = await collect(investigation.read_urls(str(urls_file)))
+
+    assert urls == ["https://www.test.com", "https://www.other.com"]
+    assert investigation.waiting == {"https://www.test.com": ["https://www.test.com", "HTTPS://WWW.TEST.COM/"],
+                                     "https://www.other.com": ["https://www.other.com"]}
+    assert output_path.read_text().splitlines() == ["url,report,screenshot,dom,outcome", "not a url,,,,rejected"]
+    assert tmp_path.joinpath("urls.rejects.csv").read_text().splitlines() == \
+           ["line,input,reason", "2,not a url,invalid URL"]
+
+
+@pytest.mark.asyncio
+async def test_read_urls_does_not_reject_lines_again_on_resume(tmp_path):
+    urls_file = tmp_path.joinpath("urls.txt")
+    urls_file.write_text("not a url\nhttps://www.test.com\nstill not a url\n")
+    output_path = tmp_path.joinpath("urls.csv")
+    # Only the first line was rejected before the previous run was interrupted
+    output_path.write_text("url,report,screenshot,dom,outcome\nnot a url,,,,rejected\n")
+    rejects_path = tmp_path.joinpath("urls.rejects.csv")
+    rejects_path.write_text("line,input,reason\n1,not a url,invalid URL\n")
+
+    async with urlscan.UrlScan(api_key="some-api-key", data_dir=tmp_path) as url_scan:
+        with batch.BatchInvestigation(url_scan, output_path, resume=True) as investigation:
+            urls = await collect(investigation.read_urls(str(urls_file)))
+
+    assert urls == ["https://www.test.com"]
+    assert output_path.read_text().splitlines()[1:] == ["not a url,,,,rejected", "still not a url,,,,rejected"]
+    assert rejects_path.read_text().splitlines()[1:] == ["1,not a url,invalid URL", "3,still not a url,invalid URL"]
+
+
+@pytest.mark.asyncio
+async def test_finish_writes_row_per_waiting_line(tmp_path):
+    output_path = tmp_path.joinpath("urls.csv")
+
+    async with urlscan.UrlScan(api_key="some-api-key", data_dir=tmp_path) as url_scan:
+        with batch.BatchInvestigation(url_scan, output_path) as investigation:
+            investigation.waiting["https://www.test.com"] = ["https://www.test.com", "https://www.test.com/"]
+            investigation.finish("https://www.test.com", {"scan_uuid": TEST_UUID, "report": "report"})
+
+    assert investigation.waiting == {}
+    assert output_path.read_text().splitlines()[1:] == ["https://www.test.com,report,,,success",
+                                                        "https://www.test.com/,report,,,success"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stage_workers, handlers", [
+    (None, ["handle"]),
+    ((1, 2, 1), ["submit", "poll", "download"])
+])
+async def test_run_wires_urls_through_handlers(mocker, tmp_path, stage_workers, handlers):
+    urls_file = tmp_path.joinpath("urls.txt")
+    urls_file.write_text("https://www.test1.com\nhttps://www.test2.com\n")
+    calls = []
+
+    def record(name):
+        async def handle(item):
+            calls.append(name)
+            return item
+        return handle
+
+    async with urlscan.UrlScan(api_key="some-api-key", data_dir=tmp_path) as url_scan:
+        with batch.BatchInvestigation(url_scan, tmp_path.joinpath("urls.csv")) as investigation:
+            for name in ("handle", "submit", "poll", "download"):
+                mocker.patch.object(investigation, name, side_effect=record(name))
+            await investigation.run(str(urls_file), workers=2, stage_workers=stage_workers)
+
+    assert sorted(calls) == sorted(handlers * 2)
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from ..context import cache
+
+TEST_UUID = "e2963e73-74e2-46d0-b9d4-db7db9d6b79d"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("compress", [True, False])
+async def test_result_cache_round_trip(tmp_path, compress):
+    result_cache = cache.ResultCache(tmp_path, compress=compress)
+    assert await result_cache.get(TEST_UUID) is None
+    await result_cache.put(TEST_UUID, b'{"task": {}}')
+    assert await result_cache.get(TEST_UUID) == b'{"task": {}}'
+
+
+@pytest.mark.asyncio
+async def test_result_cache_evicts_least_recently_used(tmp_path):
+    result_cache = cache.ResultCache(tmp_path, max_size=250, compress=False)
+    for i, scan_uuid in enumerate(["first", "second"]):
+        await result_cache.put(scan_uuid, b"x" * 100)
+        os.utime(result_cache.path(scan_uuid), (i, i))
+    await result_cache.get("first")
+
+    await result_cache.put("third", b"x" * 100)
+
+    assert await result_cache.get("second") is None
+    assert await result_cache.get("first") is not None
+    assert await result_cache.get("third") is not None
+
+
+def test_submission_index_respects_max_age(tmp_path):
+    index = cache.SubmissionIndex(tmp_path.joinpath("submissions.jsonl"))
+    index.add("https://www.test.com", TEST_UUID)
+    assert index.get("https://www.test.com", max_age=60) == TEST_UUID
+    assert index.get("https://www.other.com", max_age=60) is None
+
+    index.submissions["https://www.test.com"] = (TEST_UUID, 0)
+    assert index.get("https://www.test.com", max_age=60) is None
+
+
+def test_submission_index_reloads_unexpired_submissions(tmp_path):
+    index_path = tmp_path.joinpath("submissions.jsonl")
+    cache.SubmissionIndex(index_path).add("https://www.test.com", TEST_UUID)
+    assert cache.SubmissionIndex(index_path).get("https://www.test.com", max_age=60) == TEST_UUID
+    assert cache.SubmissionIndex(index_path, retention=-1).submissions == {}
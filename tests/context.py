@@ -7,5 +7,20 @@ PROJECT_DIR = pathlib.Path.cwd().parent.joinpath("src").absolute()
 
 sys.path.insert(0, str(PROJECT_DIR))
 
+from src.urlscanio import batch     # type: ignore
+from src.urlscanio import cache     # type: ignore
+from src.urlscanio import extract   # type: ignore
+from src.urlscanio import fastjson  # type: ignore
+from src.urlscanio import journal   # type: ignore
+from src.urlscanio import keypool   # type: ignore
+from src.urlscanio import metrics   # type: ignore
+from src.urlscanio import ratelimit # type: ignore
+from src.urlscanio import reports   # type: ignore
+from src.urlscanio import retry     # type: ignore
+from src.urlscanio import service   # type: ignore
+from src.urlscanio import store     # type: ignore
+from src.urlscanio import tracing   # type: ignore
+from src.urlscanio import transport # type: ignore
 from src.urlscanio import urlscan   # type: ignore
 from src.urlscanio import utils     # type: ignore
+from src.urlscanio import watch     # type: ignore
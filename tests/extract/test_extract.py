@@ -0,0 +1,67 @@
+import json
+import pathlib
+import sqlite3
+
+import pytest
+
+from ..context import extract
+
+SAMPLE_RESULT = pathlib.Path("tests/sample_responses/result_api.json").absolute()
+TEST_UUID = "e2963e73-74e2-46d0-b9d4-db7db9d6b79d"
+
+
+@pytest.fixture
+def result():
+    return json.loads(SAMPLE_RESULT.read_text())
+
+
+def test_request_records_are_typed(result):
+    records = list(extract.request_records(result))
+    assert len(records) == len(result["data"]["requests"])
+    record = {name: convert(records[1].get(name)) for name, convert in extract.SECTIONS["requests"]}
+    assert record["url"] == "https://www.google.com/images/hpp/shield_privacy_checkup_green_2x_web_96dp.png"
+    assert record["status"] == 200
+    assert record["ip"] == "2a00:1450:4001:824::2004"
+    assert record["port"] == 443
+    assert record["asn"] == "15169"
+
+
+def test_extractor_writes_ndjson_in_batches(tmp_path, result):
+    with extract.Extractor(tmp_path, "ndjson", ["domains", "page"], batch_size=2) as extractor:
+        counts = extractor.add(TEST_UUID, result)
+        # Full batches are written as soon as they fill up, the rest once the extractor is closed
+        written = tmp_path.joinpath("domains.ndjson").read_text().splitlines()
+        assert len(written) == counts["domains"] - counts["domains"] % 2
+        assert not tmp_path.joinpath("page.ndjson").exists()
+
+    pages = [json.loads(line) for line in tmp_path.joinpath("page.ndjson").read_text().splitlines()]
+    assert pages == [{"scan_uuid": TEST_UUID, "time": "2018-07-29T21:17:28.427Z", "url": "https://www.google.com",
+                      "domain": "www.google.com", "ip": "2a00:1450:4001:824::2004", "asn": "AS15169",
+                      "country": "IE", "server": "gws", "title": None, "malicious": None, "score": None}]
+    assert len(tmp_path.joinpath("domains.ndjson").read_text().splitlines()) == counts["domains"]
+
+
+def test_extractor_writes_sqlite(tmp_path, result):
+    with extract.Extractor(tmp_path, "sqlite", ["certificates"]) as extractor:
+        extractor.add(TEST_UUID, result)
+
+    with sqlite3.connect(tmp_path.joinpath("extract.sqlite")) as db:
+        rows = db.execute("SELECT subject_name, valid_from FROM certificates").fetchall()
+    assert rows[0] == ("www.google.com", 1529408329)
+    assert len(rows) == len(result["lists"]["certificates"])
+
+
+def test_extractor_writes_parquet(tmp_path, result):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    with extract.Extractor(tmp_path, "parquet", ["requests"], batch_size=10) as extractor:
+        extractor.add(TEST_UUID, result)
+        extractor.add(TEST_UUID, result)
+
+    table = parquet.read_table(tmp_path.joinpath("requests.parquet"))
+    assert table.num_rows == 2 * len(result["data"]["requests"])
+    assert str(table.schema.field("status").type) == "int64"
+
+
+def test_extractor_rejects_unknown_sections(tmp_path):
+    with pytest.raises(ValueError):
+        extract.Extractor(tmp_path, sections=["cookies"])
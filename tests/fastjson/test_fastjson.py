@@ -0,0 +1,24 @@
+import pytest
+
+from ..context import fastjson
+
+TEST_DOCUMENT = b'{"task": {"uuid": "abc", "domURL": "https://urlscan.io/dom/abc/"}, "data": {"requests": [1, 2]}}'
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_loads_and_dumps_round_trip(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(fastjson, "orjson", None)
+    elif fastjson.orjson is None:
+        pytest.skip("orjson is not installed")
+    body = fastjson.loads(TEST_DOCUMENT)
+    assert fastjson.loads(fastjson.dumps(body)) == body
+
+
+def test_project_keeps_requested_paths_only():
+    actual = fastjson.loads_projection(TEST_DOCUMENT, ["task.domURL", "task.missing", "data.requests"])
+    assert actual == {"task": {"domURL": "https://urlscan.io/dom/abc/"}, "data": {"requests": [1, 2]}}
+
+
+def test_project_ignores_paths_through_non_objects():
+    assert fastjson.project({"data": {"requests": [1, 2]}}, ["data.requests.first"]) == {}
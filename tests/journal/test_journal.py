@@ -0,0 +1,48 @@
+from ..context import journal
+
+TEST_URL = "https://www.test.com"
+TEST_UUID = "e2963e73-74e2-46d0-b9d4-db7db9d6b79d"
+
+
+def test_journal_resume_merges_entries(tmp_path):
+    journal_path = tmp_path.joinpath("urls.journal")
+    with journal.Journal(journal_path) as first_run:
+        first_run.record(TEST_URL, journal.Journal.SUBMITTED, scan_uuid=TEST_UUID)
+        first_run.record(TEST_URL, journal.Journal.FETCHED, report="https://urlscan.io/result/x/")
+
+    with journal.Journal(journal_path, resume=True) as second_run:
+        entry = second_run.get(TEST_URL)
+        assert entry["state"] == journal.Journal.FETCHED
+        assert entry["scan_uuid"] == TEST_UUID
+        assert second_run.get("https://www.other.com") == {}
+
+
+def test_journal_resume_keeps_one_line_per_url(tmp_path):
+    journal_path = tmp_path.joinpath("watch.jsonl")
+    with journal.Journal(journal_path, resume=True) as watch:
+        for check in range(3):
+            watch.record(TEST_URL, journal.Journal.CHECKED, scan_uuid=f"uuid-{check}")
+
+    with journal.Journal(journal_path, resume=True) as restarted:
+        assert restarted.get(TEST_URL)["scan_uuid"] == "uuid-2"
+    assert len(journal_path.read_text(encoding="utf-8").splitlines()) == 1
+
+
+def test_journal_ignores_truncated_line(tmp_path):
+    journal_path = tmp_path.joinpath("urls.journal")
+    with journal.Journal(journal_path) as first_run:
+        first_run.record(TEST_URL, journal.Journal.SUBMITTED, scan_uuid=TEST_UUID)
+    with open(journal_path, "a", encoding="utf-8") as journal_file:
+        journal_file.write('{"url": "https://www.oth')
+
+    with journal.Journal(journal_path, resume=True) as second_run:
+        assert second_run.get(TEST_URL)["scan_uuid"] == TEST_UUID
+
+
+def test_journal_without_resume_starts_fresh(tmp_path):
+    journal_path = tmp_path.joinpath("urls.journal")
+    with journal.Journal(journal_path) as first_run:
+        first_run.record(TEST_URL, journal.Journal.DONE, scan_uuid=TEST_UUID)
+
+    with journal.Journal(journal_path) as second_run:
+        assert second_run.get(TEST_URL) == {}
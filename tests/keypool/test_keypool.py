@@ -0,0 +1,54 @@
+import pytest
+
+from ..context import keypool, ratelimit
+
+EXHAUSTED_HEADERS = {
+    "X-Rate-Limit-Limit": "60",
+    "X-Rate-Limit-Remaining": "0",
+    "X-Rate-Limit-Window": "minute",
+    "X-Rate-Limit-Reset-After": "30"
+}
+
+
+def test_key_pool_from_strings():
+    pool = keypool.KeyPool.from_strings("shared-1, shared-2", "private-1", "")
+    assert [key.key for key in pool.keys] == ["shared-1", "shared-2", "private-1"]
+    assert [key.key for key in pool.usable(private=False)] == ["shared-1", "shared-2"]
+    assert [key.key for key in pool.usable(private=True)] == ["shared-1", "shared-2", "private-1"]
+    assert len(pool.usable()) == 3
+
+
+def test_key_pool_requires_a_key():
+    with pytest.raises(ValueError):
+        keypool.KeyPool.from_strings("")
+
+
+def test_key_pool_selects_key_with_most_headroom():
+    pool = keypool.KeyPool([keypool.ApiKey("first"), keypool.ApiKey("second")])
+    pool.keys[0].rate_limiter.update("scan", EXHAUSTED_HEADERS)
+    assert pool.select("scan").key == "second"
+    assert pool.select("result").key == "first"
+    assert not pool.has_headroom("scan", exclude={pool.keys[1]})
+
+
+def test_key_pool_reserves_keys_for_private_submissions():
+    pool = keypool.KeyPool.from_strings("", "private-1", "public-1")
+    assert pool.select("scan", private=True).key == "private-1"
+    assert pool.select("scan", private=False).key == "public-1"
+
+
+def test_key_pool_without_private_keys():
+    pool = keypool.KeyPool.from_strings("", "", "public-1")
+    with pytest.raises(ValueError):
+        pool.select("scan", private=True)
+
+
+def test_key_pool_keeps_last_key_when_revoking():
+    pool = keypool.KeyPool([keypool.ApiKey("first"), keypool.ApiKey("second")])
+    assert pool.revoke(pool.keys[0])
+    assert not pool.revoke(pool.keys[1])
+    assert [key.key for key in pool.usable()] == ["second"]
+
+
+def test_api_key_repr_hides_key():
+    assert "secret" not in repr(keypool.ApiKey("secret-abcd", ratelimit.RateLimiter()))
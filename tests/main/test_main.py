@@ -0,0 +1,41 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from ..context import reports
+
+ROOT_DIR = Path(__file__).absolute().parents[2]
+
+
+def run_python(code, *args, env=None):
+    return subprocess.run([sys.executable, "-c", code, *args], cwd=ROOT_DIR, capture_output=True, text=True,
+                          check=False, env=env)
+
+
+def test_entry_point_does_not_import_network_stack():
+    result = run_python("import sys; import src.urlscanio.__main__; "
+                        "print([module for module in ('asyncio', 'aiohttp', 'aiofiles') if module in sys.modules])")
+    assert result.stdout.strip() == "[]"
+
+
+def test_invalid_arguments_fail_before_network_stack_is_imported():
+    result = run_python("import sys; from src.urlscanio.__main__ import main\n"
+                        "try:\n    main()\nexcept ValueError:\n    print('aiohttp' in sys.modules)",
+                        "-i", "not-a-url")
+    assert result.stdout.strip() == "False"
+
+
+def test_search_local_answers_from_report_store(tmp_path):
+    report_store = reports.ReportStore(tmp_path.joinpath("reports.sqlite"))
+    report_store.ingest("e2963e73-74e2-46d0-b9d4-db7db9d6b79d",
+                        ROOT_DIR.joinpath("tests/sample_responses/result_api.json").read_bytes())
+    report_store.close()
+
+    env = {key: value for key, value in os.environ.items() if key != "URLSCAN_API_KEY"}
+    result = run_python("import sys; from src.urlscanio.__main__ import main; main(); print('aiohttp' in sys.modules)",
+                        "--search-local", 'domains:"google.com"', env={**env, "URLSCAN_DATA_DIR": str(tmp_path)})
+    output, network_imported = result.stdout.rsplit("\n", 2)[:2]
+    assert [report["url"] for report in json.loads(output)] == ["https://www.google.com"]
+    assert network_imported == "False"
@@ -0,0 +1,51 @@
+import json
+
+from ..context import metrics
+
+
+def test_histogram_quantiles():
+    histogram = metrics.Histogram((1, 5, 10))
+    for value in (0.5, 0.7, 3, 20):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 0, 1]
+    assert histogram.quantile(0.5) == 1
+    assert histogram.quantile(0.99) == 20
+    assert metrics.Histogram((1,)).quantile(0.5) is None
+
+
+def test_metrics_summary():
+    run_metrics = metrics.Metrics()
+    run_metrics.observe_request("result", 404, 0.2)
+    run_metrics.observe_request("result", 200, 0.3)
+    run_metrics.observe_poll(2, 12.5)
+    run_metrics.observe_download(1024)
+    run_metrics.observe_rate_limit("scan", 42)
+
+    summary = run_metrics.summary()
+    assert summary["request_latency"]["result"]["count"] == 2
+    assert summary["status_codes"] == {"result": {"404": 1, "200": 1}}
+    assert summary["poll_attempts"]["count"] == 1
+    assert summary["time_to_result"]["sum"] == 12.5
+    assert summary["bytes_downloaded"] == 1024
+    assert summary["rate_limit_remaining"] == {"scan": 42}
+
+
+def test_metrics_writers(tmp_path):
+    run_metrics = metrics.Metrics()
+    run_metrics.observe_request("scan", 200, 0.2)
+    run_metrics.write_json(tmp_path.joinpath("metrics.json"))
+    run_metrics.write_prometheus(tmp_path.joinpath("urlscanio.prom"))
+
+    assert json.loads(tmp_path.joinpath("metrics.json").read_text())["status_codes"] == {"scan": {"200": 1}}
+    prometheus = tmp_path.joinpath("urlscanio.prom").read_text()
+    assert 'urlscanio_request_duration_seconds_bucket{endpoint="scan",le="0.25"} 1' in prometheus
+    assert 'urlscanio_responses_total{endpoint="scan",status="200"} 1' in prometheus
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["metrics.json", "urlscanio.prom"]
+
+
+def test_metrics_json_stays_valid_beyond_last_bucket(tmp_path):
+    run_metrics = metrics.Metrics()
+    run_metrics.observe_request("doms", 200, 75)
+    run_metrics.write_json(tmp_path.joinpath("metrics.json"))
+    latency = json.loads(tmp_path.joinpath("metrics.json").read_text())["request_latency"]["doms"]
+    assert latency["p50"] == latency["p99"] == 75
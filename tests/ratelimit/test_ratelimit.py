@@ -0,0 +1,49 @@
+import pytest
+
+from ..context import ratelimit
+
+
+def test_rate_limiter_uses_default_rates_until_headers_seen():
+    limiter = ratelimit.RateLimiter()
+    bucket = limiter.bucket("scan")
+    assert (bucket.rate, bucket.capacity) == ratelimit.RateLimiter.DEFAULT_RATES["scan"]
+
+
+def test_rate_limiter_update_from_headers():
+    limiter = ratelimit.RateLimiter()
+    updated = limiter.update("scan", {
+        "X-Rate-Limit-Limit": "120",
+        "X-Rate-Limit-Remaining": "100",
+        "X-Rate-Limit-Window": "minute",
+        "X-Rate-Limit-Reset-After": "30"
+    })
+    assert updated
+    bucket = limiter.bucket("scan")
+    assert bucket.capacity == 120
+    assert bucket.rate == 2
+    assert limiter.remaining("scan") >= 100
+
+
+def test_rate_limiter_ignores_missing_headers():
+    limiter = ratelimit.RateLimiter()
+    assert not limiter.update("search", {})
+
+
+def test_rate_limiter_waits_for_reset_when_exhausted():
+    limiter = ratelimit.RateLimiter()
+    limiter.update("result", {
+        "X-Rate-Limit-Limit": "60",
+        "X-Rate-Limit-Remaining": "0",
+        "X-Rate-Limit-Window": "minute",
+        "X-Rate-Limit-Reset-After": "10"
+    })
+    assert limiter.remaining("result") == 0
+    assert limiter.bucket("result").tokens == pytest.approx(-9, abs=0.1)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_acquire_consumes_token():
+    bucket = ratelimit.TokenBucket(rate=100, capacity=2)
+    await bucket.acquire()
+    await bucket.acquire()
+    assert bucket.tokens < 1
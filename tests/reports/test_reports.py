@@ -0,0 +1,51 @@
+import json
+import pathlib
+
+import pytest
+
+from ..context import reports
+
+SAMPLE_RESULT = pathlib.Path("tests/sample_responses/result_api.json").absolute()
+TEST_UUID = "e2963e73-74e2-46d0-b9d4-db7db9d6b79d"
+
+
+@pytest.fixture
+def report_store(tmp_path):
+    report_store = reports.ReportStore(tmp_path.joinpath("reports.sqlite"))
+    yield report_store
+    report_store.close()
+
+
+def test_ingest_indexes_key_fields(report_store):
+    assert report_store.ingest(TEST_UUID, SAMPLE_RESULT.read_bytes())
+    assert report_store.contains(TEST_UUID)
+
+    results = report_store.search('domains:"gstatic.com"')
+    assert [result["uuid"] for result in results] == [TEST_UUID]
+    assert results[0]["domain"] == "www.google.com"
+    assert results[0]["asn"] == "AS15169"
+    assert report_store.search('ips:"2a00:1450:4001:824::2004"')
+    assert report_store.search("hashes:6a9367d8f4f041ed12ac021fb2d13edcd3118a86cbb701551d73d0fb836d78a8")
+    assert report_store.search('certificates:"Google Internet Authority G3"')
+    assert not report_store.search('domains:"example.com"')
+
+
+def test_ingest_skips_known_results(report_store):
+    assert report_store.ingest(TEST_UUID, SAMPLE_RESULT.read_bytes())
+    assert not report_store.ingest(TEST_UUID, b"not even json")
+
+
+def test_search_by_verdict(report_store):
+    body = json.loads(SAMPLE_RESULT.read_text())
+    body["verdicts"] = {"overall": {"malicious": True, "score": 100, "categories": ["phishing"],
+                                    "brands": [{"key": "google", "name": "Google"}], "tags": []}}
+    report_store.ingest(TEST_UUID, json.dumps(body))
+
+    results = report_store.search("verdicts:phishing AND verdicts:google")
+    assert [(result["malicious"], result["score"]) for result in results] == [(1, 100)]
+    assert report_store.search("verdicts:malicious", limit=1)
+
+
+def test_search_with_invalid_query(report_store):
+    with pytest.raises(ValueError):
+        report_store.search('domains:"unterminated')
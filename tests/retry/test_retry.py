@@ -0,0 +1,69 @@
+import asyncio
+import logging
+
+import pytest
+
+from ..context import retry
+
+LOGGER = logging.getLogger("urlscanio")
+
+
+def test_delay_honours_retry_after_seconds():
+    assert retry.RetryPolicy().delay(1, {"Retry-After": "12"}) == 12
+
+
+def test_delay_honours_retry_after_date():
+    delay = retry.RetryPolicy().delay(1, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})
+    assert delay == 0
+
+
+def test_delay_falls_back_to_rate_limit_reset():
+    assert retry.RetryPolicy().delay(1, {"X-Rate-Limit-Reset-After": "4.5"}) == 4.5
+
+
+def test_delay_backs_off_exponentially_up_to_cap():
+    policy = retry.RetryPolicy(base_delay=1, max_delay=8)
+    assert 0.5 <= policy.delay(1) <= 1
+    assert 4 <= policy.delay(4) <= 8
+    assert 4 <= policy.delay(10) <= 8
+
+
+@pytest.mark.asyncio
+async def test_run_returns_non_retryable_status_immediately():
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return 404, {}, b"not found"
+
+    assert await retry.RetryPolicy().run(call, LOGGER, "test") == (404, b"not found")
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_run_stops_at_deadline():
+    async def call():
+        return 503, {"Retry-After": "60"}, b""
+
+    assert await retry.RetryPolicy(deadline=1).run(call, LOGGER, "test") == (503, b"")
+
+
+@pytest.mark.asyncio
+async def test_run_without_deadline_lets_slow_calls_finish():
+    async def call():
+        await asyncio.sleep(0.2)
+        return 200, {}, b"artifact"
+
+    policy = retry.RetryPolicy(deadline=0.05)
+    with pytest.raises(asyncio.TimeoutError):
+        await policy.run(call, LOGGER, "test")
+    assert await policy.without_deadline().run(call, LOGGER, "test") == (200, b"artifact")
+
+
+@pytest.mark.asyncio
+async def test_deadline_paused_time_does_not_count():
+    deadline = retry.Deadline(0.1)
+    await deadline.paused(asyncio.sleep(0.2))
+    assert await deadline.bound(asyncio.sleep(0.01, "done")) == "done"
+    with pytest.raises(asyncio.TimeoutError):
+        await deadline.bound(asyncio.sleep(0.2))
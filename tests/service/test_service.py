@@ -0,0 +1,128 @@
+import asyncio
+import contextlib
+import logging
+
+import pytest
+
+from ..context import metrics, service
+
+TEST_URL = "https://www.example.com"
+TEST_UUID = "5f7ab1e4-8d2c-4c7e-9a0e-3b1d2f4a6c8e"
+
+
+class FakeUrlScan:
+    def __init__(self):
+        self.logger = logging.getLogger("urlscanio")
+        self.metrics = metrics.Metrics()
+        self.running = 0
+        self.max_running = 0
+
+    async def investigate(self, url, private=False):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return {"scan_uuid": TEST_UUID, "report": f"{url}/report", "screenshot": "s.png", "dom": "d.txt",
+                "private": private}
+
+    async def fetch_result(self, scan_uuid):
+        raise KeyError("task")
+
+    async def submit_scan_request(self, url, private=False):
+        return TEST_UUID
+
+    async def get_result_data(self, scan_uuid):
+        return {"task": {"uuid": scan_uuid}}
+
+    async def search(self, query):
+        return {"results": [{"query": query}], "has_more": False}
+
+    async def iter_search(self, query, limit=None):
+        for i in range(limit or 3):
+            yield {"query": query, "index": i}
+
+
+@contextlib.asynccontextmanager
+async def running_service(tmp_path):
+    url_scan = FakeUrlScan()
+    scan_service = service.ScanService(url_scan, jobs=2)
+    address = f"unix:{tmp_path.joinpath('s.sock')}"
+    await scan_service.start(address)
+    yield url_scan, address
+    await scan_service.stop()
+
+
+def test_parse_address():
+    assert service.parse_address("unix:/tmp/urlscanio.sock") == ("/tmp/urlscanio.sock", None)
+    assert service.parse_address("0.0.0.0:8765") == ("0.0.0.0", 8765)
+    assert service.parse_address(":8765") == ("127.0.0.1", 8765)
+
+
+@pytest.mark.asyncio
+async def test_service_runs_jobs_from_many_clients_through_one_scheduler(tmp_path):
+    async with running_service(tmp_path) as (url_scan, address):
+        clients = [service.ServiceClient(address) for _ in range(3)]
+        results = await asyncio.gather(*[clients[i % 3].investigate(f"{TEST_URL}/{i}", i == 0) for i in range(6)])
+        for client in clients:
+            await client.session.close()
+
+        assert [result["report"] for result in results] == [f"{TEST_URL}/{i}/report" for i in range(6)]
+        assert results[0]["private"] and not results[1]["private"]
+        assert url_scan.max_running == 2
+
+
+@pytest.mark.asyncio
+async def test_service_client_mirrors_url_scan(tmp_path):
+    async with running_service(tmp_path) as (_, address):
+        async with service.ServiceClient(address) as client:
+            assert await client.submit_scan_request(TEST_URL) == TEST_UUID
+            assert await client.get_result_data(TEST_UUID) == {"task": {"uuid": TEST_UUID}}
+            assert await client.search("domain:example.com") == {"results": [{"query": "domain:example.com"}],
+                                                                   "has_more": False}
+            streamed = [result async for result in client.iter_search("domain:example.com", limit=2)]
+            assert streamed == [{"query": "domain:example.com", "index": i} for i in range(2)]
+
+
+@pytest.mark.asyncio
+async def test_service_reports_failed_jobs(tmp_path):
+    async with running_service(tmp_path) as (_, address):
+        async with service.ServiceClient(address) as client:
+            with pytest.raises(RuntimeError):
+                await client.fetch_result(TEST_UUID)
+            async with client.post("investigate", {"uuid": TEST_UUID}) as response:
+                assert response.status == 400
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("endpoint, payload", [
+    ("investigate", {"url": "www.example.com"}),
+    ("submit", {"url": "https://"}),
+    ("retrieve", {"uuid": "../../etc/passwd"}),
+    ("report", {"uuid": "not-a-uuid"})
+])
+async def test_service_rejects_malformed_values(tmp_path, endpoint, payload):
+    async with running_service(tmp_path) as (_, address):
+        async with service.ServiceClient(address) as client:
+            async with client.post(endpoint, payload) as response:
+                assert response.status == 400
+
+
+@pytest.mark.asyncio
+async def test_service_client_reports_unexpected_errors(tmp_path):
+    async def search(query):
+        raise ValueError(query)
+
+    async with running_service(tmp_path) as (url_scan, address):
+        url_scan.search = search
+        async with service.ServiceClient(address) as client:
+            with pytest.raises(RuntimeError):
+                await client.search("domain:example.com")
+
+
+@pytest.mark.asyncio
+async def test_service_exposes_metrics(tmp_path):
+    async with running_service(tmp_path) as (url_scan, address):
+        url_scan.metrics.observe_download(42)
+        async with service.ServiceClient(address) as client:
+            async with client.session.get(f"{client.base_url}/metrics") as response:
+                assert "urlscanio_downloaded_bytes_total 42" in await response.text()
@@ -0,0 +1,46 @@
+import pytest
+
+from ..context import store
+
+
+async def put(artifact_store, name, content):
+    async with artifact_store.open_blob(name) as blob:
+        for i in range(0, len(content), 3):
+            await blob.write(content[i:i + 3])
+    return blob.location
+
+
+@pytest.mark.asyncio
+async def test_artifact_store_deduplicates_identical_content(tmp_path):
+    artifact_store = store.ArtifactStore(tmp_path)
+    first = await put(artifact_store, "doms/first.txt", b"<html>parked</html>")
+    second = await put(artifact_store, "doms/second.txt", b"<html>parked</html>")
+
+    assert first == second
+    assert len(list(tmp_path.joinpath("blobs").rglob("*.gz"))) == 1
+    assert artifact_store.read("doms/first.txt") == b"<html>parked</html>"
+    assert artifact_store.read("doms/second.txt") == b"<html>parked</html>"
+    artifact_store.close()
+
+
+@pytest.mark.asyncio
+async def test_artifact_store_read_missing_artifact(tmp_path):
+    artifact_store = store.ArtifactStore(tmp_path)
+    assert artifact_store.read("doms/missing.txt") is None
+    artifact_store.close()
+
+
+@pytest.mark.asyncio
+async def test_artifact_store_zstd(tmp_path):
+    if store.zstandard is None:
+        pytest.skip("zstandard is not installed")
+    artifact_store = store.ArtifactStore(tmp_path, compression="zstd")
+    location = await put(artifact_store, "screenshots/a.png", b"\x89PNG" * 100)
+    assert location.suffix == ".zst"
+    assert artifact_store.read("screenshots/a.png") == b"\x89PNG" * 100
+    artifact_store.close()
+
+
+def test_artifact_store_rejects_unknown_compression(tmp_path):
+    with pytest.raises(ValueError):
+        store.ArtifactStore(tmp_path, compression="lzma")
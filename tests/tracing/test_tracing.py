@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from ..context import tracing
+
+TEST_URL = "https://www.test.com"
+TEST_UUID = "e2963e73-74e2-46d0-b9d4-db7db9d6b79d"
+
+
+def record_investigation(tracer):
+    root = tracer.start("investigate", url=TEST_URL)
+    with tracer.activate(root):
+        with tracer.span("submit"):
+            with tracer.span("POST scan", **{"http.request.method": "POST"}):
+                pass
+        root.set(scan_uuid=TEST_UUID)
+    tracer.end(root)
+
+
+def test_spans_inherit_url_and_scan_uuid():
+    tracer = tracing.Tracer()
+    record_investigation(tracer)
+
+    spans = {span.name: span for span in tracer.finished_spans()}
+    assert spans["POST scan"].parent is spans["submit"]
+    assert spans["POST scan"].trace_id == spans["investigate"].trace_id
+    assert spans["POST scan"].tags() == {"url": TEST_URL, "scan_uuid": TEST_UUID, "http.request.method": "POST"}
+
+
+def test_span_records_error():
+    tracer = tracing.Tracer()
+    with pytest.raises(KeyError):
+        with tracer.span("download"):
+            raise KeyError("task")
+
+    assert tracer.spans[0].attributes["error"] == "KeyError('task')"
+
+
+def test_open_spans_are_marked_unfinished():
+    tracer = tracing.Tracer()
+    tracer.start("investigate", url=TEST_URL)
+
+    spans = tracer.finished_spans()
+    assert spans[0].attributes["unfinished"]
+    assert spans[0].ended_at >= spans[0].started_at
+
+
+def test_disabled_tracer_keeps_nothing():
+    tracer = tracing.Tracer(enabled=False)
+    record_investigation(tracer)
+    assert tracer.finished_spans() == []
+
+
+def test_write_chrome_trace(tmp_path):
+    tracer = tracing.Tracer()
+    record_investigation(tracer)
+    record_investigation(tracer)
+    tracer.write(tmp_path.joinpath("trace.json"))
+
+    events = json.loads(tmp_path.joinpath("trace.json").read_text())["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    threads = [event for event in events if event["ph"] == "M"]
+    assert len(spans) == 6
+    # Each investigation gets its own row, named after its URL
+    assert sorted({event["tid"] for event in spans}) == [1, 2]
+    assert [event["args"]["name"] for event in threads] == [TEST_URL, TEST_URL]
+    assert all(event["dur"] >= 0 and event["ts"] >= 0 for event in spans)
+
+
+def test_write_otlp_trace(tmp_path):
+    tracer = tracing.Tracer()
+    record_investigation(tracer)
+    tracer.write(tmp_path.joinpath("trace.json"), "otlp")
+
+    scope_spans = json.loads(tmp_path.joinpath("trace.json").read_text())["resourceSpans"][0]["scopeSpans"]
+    spans = {span["name"]: span for span in scope_spans[0]["spans"]}
+    assert spans["submit"]["parentSpanId"] == spans["investigate"]["spanId"]
+    assert spans["investigate"]["parentSpanId"] == ""
+    assert len(spans["investigate"]["traceId"]) == 32
+    assert spans["POST scan"]["kind"] == 3
+    assert {"key": "scan_uuid", "value": {"stringValue": TEST_UUID}} in spans["POST scan"]["attributes"]
+
+
+def test_write_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        tracing.Tracer().write(tmp_path.joinpath("trace.json"), "zipkin")
@@ -0,0 +1,16 @@
+import pytest
+
+from ..context import transport
+
+
+@pytest.mark.asyncio
+async def test_create_session_applies_connection_settings():
+    async with transport.create_session(limit=7, limit_per_host=3, connect_timeout=2, read_timeout=5) as session:
+        assert session.connector.limit == 7
+        assert session.connector.limit_per_host == 3
+        assert session.timeout.sock_connect == 2
+        assert session.timeout.sock_read == 5
+
+
+def test_install_event_loop_policy_without_uvloop():
+    assert not transport.install_event_loop_policy(use_uvloop=False)
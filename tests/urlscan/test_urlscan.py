@@ -1,9 +1,17 @@
+import asyncio
+import hashlib
+import io
 import json
+import re
+from datetime import datetime, timezone
 
+import aiohttp
 import pytest
 from aioresponses import aioresponses
+from yarl import URL
 
-from ..context import urlscan
+from ..context import (cache, extract, journal, keypool, ratelimit, reports, retry, store, tracing, transport,
+                       urlscan, utils)
 
 
 # Utility function to allow for mocking async function returns
@@ -50,9 +58,8 @@ async def test_fetch_result(mocker, test_urlscan_params, success_result_response
 
 
 @pytest.mark.asyncio
-async def test_download_screenshot(mocker, test_urlscan_params, screenshot_response):
-    mock_save_file = mocker.patch("src.urlscanio.urlscan.UrlScan.save_file")
-    mock_save_file.return_value = return_async(None)
+async def test_download_screenshot(tmp_path, test_urlscan_params, screenshot_response):
+    utils.create_data_dir(tmp_path)
 
     with aioresponses() as mocked:
         mocked.get(test_urlscan_params["screenshot"]["link"],
@@ -60,24 +67,773 @@ async def test_download_screenshot(mocker, test_urlscan_params, screenshot_respo
                    body=screenshot_response)
 
         async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
-                                   data_dir=test_urlscan_params["data_dir"]) as url_scan:
+                                   data_dir=tmp_path) as url_scan:
             actual = await url_scan.download_screenshot(test_urlscan_params["screenshot"]["link"])
-            assert str(test_urlscan_params["screenshot"]["path"]) == actual
-            mock_save_file.assert_called_once_with(test_urlscan_params["screenshot"]["path"], screenshot_response)
+            assert str(tmp_path.joinpath(test_urlscan_params["screenshot"]["path"])) == actual
+            assert screenshot_response == tmp_path.joinpath(test_urlscan_params["screenshot"]["path"]).read_bytes()
 
 
 @pytest.mark.asyncio
-async def test_download_dom(mocker, test_urlscan_params, dom_response):
-    mock_save_file = mocker.patch("src.urlscanio.urlscan.UrlScan.save_file")
-    mock_save_file.return_value = return_async(None)
+async def test_download_dom(tmp_path, test_urlscan_params, dom_response):
+    utils.create_data_dir(tmp_path)
 
     with aioresponses() as mocked:
         mocked.get(test_urlscan_params["dom"]["link"],
                    status=200,
                    body=dom_response)
 
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=tmp_path) as url_scan:
+            actual = await url_scan.download_dom(test_urlscan_params["uuid"], test_urlscan_params["dom"]["link"])
+            assert str(tmp_path.joinpath(test_urlscan_params["dom"]["path"])) == actual
+            assert dom_response == tmp_path.joinpath(test_urlscan_params["dom"]["path"]).read_text(encoding="utf-8")
+
+
+@pytest.mark.asyncio
+async def test_download_leaves_no_partial_file_on_failure(tmp_path, test_urlscan_params):
+    utils.create_data_dir(tmp_path)
+
+    with aioresponses() as mocked:
+        mocked.get(test_urlscan_params["dom"]["link"], status=404)
+
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=tmp_path) as url_scan:
+            assert await url_scan.download_dom(test_urlscan_params["uuid"], test_urlscan_params["dom"]["link"]) is None
+            assert list(tmp_path.joinpath("doms").iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_download_skips_complete_local_copy(tmp_path, test_urlscan_params, dom_response):
+    utils.create_data_dir(tmp_path)
+
+    with aioresponses() as mocked:
+        mocked.get(test_urlscan_params["dom"]["link"], status=200, body=dom_response)
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=tmp_path) as url_scan:
+            first = await url_scan.download_dom(test_urlscan_params["uuid"], test_urlscan_params["dom"]["link"])
+            second = await url_scan.download_dom(test_urlscan_params["uuid"], test_urlscan_params["dom"]["link"])
+
+    assert first == second
+    assert len(mocked.requests) == 1
+    assert url_scan.metrics.downloads_skipped == 1
+    sidecar = json.loads(tmp_path.joinpath("doms", f".{test_urlscan_params['uuid']}.txt.meta").read_text())
+    assert sidecar == {"size": len(dom_response.encode("utf-8")),
+                       "sha256": hashlib.sha256(dom_response.encode("utf-8")).hexdigest()}
+
+
+@pytest.mark.asyncio
+async def test_download_replaces_truncated_local_copy(tmp_path, test_urlscan_params, dom_response):
+    utils.create_data_dir(tmp_path)
+    dom_path = tmp_path.joinpath(test_urlscan_params["dom"]["path"])
+
+    with aioresponses() as mocked:
+        mocked.get(test_urlscan_params["dom"]["link"], status=200, body=dom_response, repeat=True)
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=tmp_path) as url_scan:
+            await url_scan.download_dom(test_urlscan_params["uuid"], test_urlscan_params["dom"]["link"])
+            dom_path.write_text(dom_response[:10], encoding="utf-8")
+            await url_scan.download_dom(test_urlscan_params["uuid"], test_urlscan_params["dom"]["link"])
+
+    assert dom_path.read_text(encoding="utf-8") == dom_response
+    assert url_scan.metrics.downloads_skipped == 0
+
+
+@pytest.mark.asyncio
+async def test_download_replaces_local_copy_without_sidecar(tmp_path, test_urlscan_params, dom_response):
+    utils.create_data_dir(tmp_path)
+    dom_path = tmp_path.joinpath(test_urlscan_params["dom"]["path"])
+    dom_path.write_text(dom_response[:10], encoding="utf-8")
+
+    with aioresponses() as mocked:
+        mocked.get(test_urlscan_params["dom"]["link"], status=200, body=dom_response)
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=tmp_path) as url_scan:
+            actual = await url_scan.download_dom(test_urlscan_params["uuid"], test_urlscan_params["dom"]["link"])
+
+    assert str(dom_path) == actual
+    assert dom_path.read_text(encoding="utf-8") == dom_response
+    assert url_scan.read_sidecar(dom_path)["size"] == len(dom_response.encode("utf-8"))
+    assert url_scan.metrics.downloads_skipped == 0
+
+
+@pytest.mark.asyncio
+async def test_download_forced(tmp_path, test_urlscan_params, dom_response):
+    utils.create_data_dir(tmp_path)
+
+    with aioresponses() as mocked:
+        mocked.get(test_urlscan_params["dom"]["link"], status=200, body=dom_response, repeat=True)
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=tmp_path, force_downloads=True) as url_scan:
+            await url_scan.download_dom(test_urlscan_params["uuid"], test_urlscan_params["dom"]["link"])
+            await url_scan.download_dom(test_urlscan_params["uuid"], test_urlscan_params["dom"]["link"])
+
+    assert len(next(iter(mocked.requests.values()))) == 2
+    assert url_scan.metrics.downloads_skipped == 0
+
+
+@pytest.mark.asyncio
+async def test_submit_scan_request_updates_rate_limiter(test_urlscan_params, submit_response):
+    rate_limit_headers = {
+        "X-Rate-Limit-Limit": "60",
+        "X-Rate-Limit-Remaining": "59",
+        "X-Rate-Limit-Window": "minute",
+        "X-Rate-Limit-Reset-After": "59"
+    }
+    with aioresponses() as mocked:
+        mocked.post(test_urlscan_params["submit_url"],
+                    status=200,
+                    body=json.dumps(submit_response),
+                    headers=rate_limit_headers)
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"]) as url_scan:
+            await url_scan.submit_scan_request("https://www.test.com")
+            assert url_scan.rate_limiter.bucket("scan").capacity == 60
+
+
+@pytest.mark.asyncio
+async def test_batch_investigate_writes_row_per_url(mocker, tmp_path, test_urlscan_params):
+    urls = [f"https://www.test{i}.com" for i in range(5)]
+    urls_file = tmp_path.joinpath("urls.txt")
+    urls_file.write_text("\n".join(urls) + "\n")
+    output_path = tmp_path.joinpath("urls.csv")
+
+    async def fake_investigate(url, *_):
+        return {"scan_uuid": str(test_urlscan_params["uuid"]), "report": f"{url}/report"}
+    mocker.patch("src.urlscanio.urlscan.UrlScan.investigate", side_effect=fake_investigate)
+
+    async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                               data_dir=test_urlscan_params["data_dir"]) as url_scan:
+        actual = await url_scan.batch_investigate(str(urls_file), workers=2, output_path=output_path)
+
+    assert output_path == actual
+    rows = output_path.read_text().splitlines()
+    assert rows[0] == "url,report,screenshot,dom,outcome"
+    assert sorted(row.split(",")[0] for row in rows[1:]) == urls
+
+
+@pytest.mark.asyncio
+async def test_batch_investigate_dedups_and_rejects_urls(mocker, tmp_path, test_urlscan_params):
+    lines = ["https://www.test.com", "", "HTTPS://WWW.TEST.COM:443/#top", "not a url", "https://www.test.com/",
+             "http://www.other.com:8080/page/"]
+    urls_file = tmp_path.joinpath("urls.txt")
+    urls_file.write_text("\n".join(lines) + "\n")
+    output_path = tmp_path.joinpath("urls.csv")
+
+    async def fake_investigate(url, *_):
+        return {"scan_uuid": "some-uuid", "report": f"{url}/report"}
+    mock_investigate = mocker.patch("src.urlscanio.urlscan.UrlScan.investigate", side_effect=fake_investigate)
+
+    async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                               data_dir=test_urlscan_params["data_dir"]) as url_scan:
+        await url_scan.batch_investigate(str(urls_file), workers=2, output_path=output_path)
+
+    assert sorted(call.args[0] for call in mock_investigate.call_args_list) == \
+           ["http://www.other.com:8080/page", "https://www.test.com"]
+    rows = sorted(output_path.read_text().splitlines()[1:])
+    assert rows == [
+        "HTTPS://WWW.TEST.COM:443/#top,https://www.test.com/report,,,success",
+        "http://www.other.com:8080/page/,http://www.other.com:8080/page/report,,,success",
+        "https://www.test.com,https://www.test.com/report,,,success",
+        "https://www.test.com/,https://www.test.com/report,,,success",
+        "not a url,,,,rejected"
+    ]
+    assert tmp_path.joinpath("urls.rejects.csv").read_text().splitlines() == \
+           ["line,input,reason", "4,not a url,invalid URL"]
+
+
+@pytest.mark.asyncio
+async def test_run_pipeline_limits_each_stage():
+    running = {"first": 0, "second": 0}
+    peaks = {"first": 0, "second": 0}
+    outputs = []
+
+    def stage(name, delay, output=None):
+        async def handle(item):
+            running[name] += 1
+            peaks[name] = max(peaks[name], running[name])
+            await asyncio.sleep(delay)
+            running[name] -= 1
+            if output is not None:
+                output.append(item)
+            return None if item % 5 == 0 else item * 10
+        return handle
+
+    async def items():
+        for item in range(1, 21):
+            yield item
+
+    await urlscan.UrlScan.run_pipeline(items(), [(stage("first", 0), 4), (stage("second", 0.01, outputs), 2)])
+
+    assert sorted(outputs) == [item * 10 for item in range(1, 21) if item % 5 != 0]
+    assert peaks == {"first": 4, "second": 2}
+
+
+@pytest.mark.asyncio
+async def test_batch_investigate_in_stages(mocker, tmp_path, test_urlscan_params, success_result_response):
+    urls = [f"https://www.test{i}.com" for i in range(6)]
+    urls_file = tmp_path.joinpath("urls.txt")
+    urls_file.write_text("\n".join(urls) + "\n")
+    output_path = tmp_path.joinpath("urls.csv")
+
+    async def fake_submit(url, *_):
+        return "" if url.endswith("0.com") else f"uuid-{url[-5]}"
+    mocker.patch("src.urlscanio.urlscan.UrlScan.submit_scan_request", side_effect=fake_submit)
+    mock_check_result = mocker.patch("src.urlscanio.urlscan.UrlScan.check_result")
+    mock_check_result.return_value = (200, success_result_response)
+
+    async def fake_download(scan_uuid, body):
+        return {"scan_uuid": scan_uuid, "report": f"{scan_uuid}/report"}
+    mocker.patch("src.urlscanio.urlscan.UrlScan.download_artifacts", side_effect=fake_download)
+
+    async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                               data_dir=test_urlscan_params["data_dir"]) as url_scan:
+        url_scan.DEFAULT_PAUSE_TIME = 0
+        url_scan.scan_latency = 0
+        await url_scan.batch_investigate(str(urls_file), output_path=output_path, stage_workers=(1, 3, 2))
+
+    rows = sorted(output_path.read_text().splitlines()[1:])
+    assert rows == ["https://www.test0.com,,,,failure"] + \
+           [f"https://www.test{i}.com,uuid-{i}/report,,,success" for i in range(1, 6)]
+
+
+@pytest.mark.asyncio
+async def test_batch_investigate_resume_reuses_submitted_scans(mocker, tmp_path, test_urlscan_params):
+    urls_file = tmp_path.joinpath("urls.txt")
+    urls_file.write_text("https://www.done.com\nhttps://www.submitted.com\n")
+    output_path = tmp_path.joinpath("urls.csv")
+    output_path.write_text("url,report,screenshot,dom\nhttps://www.done.com,report,,\n")
+    with journal.Journal(output_path.with_suffix(".journal")) as previous_run:
+        previous_run.record("https://www.done.com", journal.Journal.DONE, scan_uuid="done-uuid")
+        previous_run.record("https://www.submitted.com", journal.Journal.SUBMITTED, scan_uuid="submitted-uuid")
+
+    mock_investigate = mocker.patch("src.urlscanio.urlscan.UrlScan.investigate")
+    mock_investigate.return_value = {"scan_uuid": "submitted-uuid", "report": "report"}
+
+    async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                               data_dir=test_urlscan_params["data_dir"]) as url_scan:
+        await url_scan.batch_investigate(str(urls_file), output_path=output_path, resume=True)
+
+    mock_investigate.assert_called_once()
+    assert mock_investigate.call_args.args[:3] == ("https://www.submitted.com", False, "submitted-uuid")
+    assert len(output_path.read_text().splitlines()) == 3
+
+
+@pytest.mark.asyncio
+async def test_batch_investigate_resume_skips_failed_urls(mocker, tmp_path, test_urlscan_params):
+    urls_file = tmp_path.joinpath("urls.txt")
+    urls_file.write_text("https://www.broken.com\nhttps://www.working.com\n")
+    output_path = tmp_path.joinpath("urls.csv")
+
+    async def fake_investigate(url, *_):
+        if "broken" in url:
+            raise aiohttp.ClientConnectionError()
+        return {"scan_uuid": "some-uuid", "report": "report"}
+    mock_investigate = mocker.patch("src.urlscanio.urlscan.UrlScan.investigate", side_effect=fake_investigate)
+
+    async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                               data_dir=test_urlscan_params["data_dir"]) as url_scan:
+        await url_scan.batch_investigate(str(urls_file), output_path=output_path)
+        await url_scan.batch_investigate(str(urls_file), output_path=output_path, resume=True)
+
+    assert mock_investigate.call_count == 2
+    rows = sorted(output_path.read_text().splitlines()[1:])
+    assert rows == ["https://www.broken.com,,,,failure", "https://www.working.com,report,,,success"]
+
+
+@pytest.mark.asyncio
+async def test_batch_investigate_resume_polls_failed_scans_again(mocker, tmp_path, test_urlscan_params):
+    urls_file = tmp_path.joinpath("urls.txt")
+    urls_file.write_text("https://www.unscanned.com\nhttps://www.slow.com\n")
+    output_path = tmp_path.joinpath("urls.csv")
+    output_path.write_text("url,report,screenshot,dom,outcome\nhttps://www.unscanned.com,,,,failure\n"
+                           "https://www.slow.com,https://urlscan.io/result/slow-uuid/,,,failure\n")
+    with journal.Journal(output_path.with_suffix(".journal")) as previous_run:
+        previous_run.record("https://www.unscanned.com", journal.Journal.FAILED, scan_uuid=None)
+        previous_run.record("https://www.slow.com", journal.Journal.SUBMITTED, scan_uuid="slow-uuid")
+        previous_run.record("https://www.slow.com", journal.Journal.FAILED, scan_uuid="slow-uuid")
+
+    mock_investigate = mocker.patch("src.urlscanio.urlscan.UrlScan.investigate")
+    mock_investigate.return_value = {"scan_uuid": "slow-uuid", "report": "report"}
+
+    async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                               data_dir=test_urlscan_params["data_dir"]) as url_scan:
+        await url_scan.batch_investigate(str(urls_file), output_path=output_path, resume=True)
+
+    mock_investigate.assert_called_once()
+    assert mock_investigate.call_args.args[:3] == ("https://www.slow.com", False, "slow-uuid")
+    assert output_path.read_text().splitlines()[-1] == "https://www.slow.com,report,,,success"
+
+
+@pytest.mark.asyncio
+async def test_batch_investigate_resume_keeps_journal_without_output(mocker, tmp_path, test_urlscan_params):
+    urls_file = tmp_path.joinpath("urls.txt")
+    urls_file.write_text("https://www.done.com\nhttps://www.new.com\n")
+    output_path = tmp_path.joinpath("urls.csv")
+    journal_path = output_path.with_suffix(".journal")
+    with journal.Journal(journal_path) as previous_run:
+        previous_run.record("https://www.done.com", journal.Journal.DONE, scan_uuid="done-uuid")
+
+    mock_investigate = mocker.patch("src.urlscanio.urlscan.UrlScan.investigate")
+    mock_investigate.return_value = {"scan_uuid": "new-uuid", "report": "report"}
+
+    async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                               data_dir=test_urlscan_params["data_dir"]) as url_scan:
+        await url_scan.batch_investigate(str(urls_file), output_path=output_path, resume=True)
+
+    mock_investigate.assert_called_once()
+    assert mock_investigate.call_args.args[0] == "https://www.new.com"
+    assert output_path.read_text().splitlines() == ["url,report,screenshot,dom,outcome",
+                                                    "https://www.new.com,report,,,success"]
+    with journal.Journal(journal_path, resume=True) as current_run:
+        assert current_run.get("https://www.done.com")["state"] == journal.Journal.DONE
+
+
+@pytest.mark.asyncio
+async def test_investigate_polls_until_result_ready(mocker, test_urlscan_params, submit_response,
+                                                    success_result_response, not_found_result_response):
+    mock_download_artifacts = mocker.patch("src.urlscanio.urlscan.UrlScan.download_artifacts")
+    mock_download_artifacts.return_value = {"scan_uuid": submit_response["uuid"], "report": "report"}
+
+    with aioresponses() as mocked:
+        mocked.post(test_urlscan_params["submit_url"], status=200, body=json.dumps(submit_response))
+        mocked.get(test_urlscan_params["result_url"], status=404, body=json.dumps(not_found_result_response))
+        mocked.get(test_urlscan_params["result_url"], status=200, body=json.dumps(success_result_response))
+
         async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
                                    data_dir=test_urlscan_params["data_dir"]) as url_scan:
+            url_scan.DEFAULT_PAUSE_TIME = 0
+            url_scan.scan_latency = 0
+            actual = await url_scan.investigate("https://www.test.com")
+
+    assert actual["report"] == "report"
+    mock_download_artifacts.assert_called_once()
+    assert url_scan.scan_latency < url_scan.DEFAULT_SCAN_LATENCY
+
+
+@pytest.mark.asyncio
+async def test_investigate_stops_polling_on_terminal_error(mocker, test_urlscan_params, submit_response):
+    mock_download_artifacts = mocker.patch("src.urlscanio.urlscan.UrlScan.download_artifacts")
+
+    with aioresponses() as mocked:
+        mocked.post(test_urlscan_params["submit_url"], status=200, body=json.dumps(submit_response))
+        mocked.get(test_urlscan_params["result_url"], status=410, body="{}")
+
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"]) as url_scan:
+            url_scan.DEFAULT_PAUSE_TIME = 0
+            url_scan.scan_latency = 0
+            actual = await url_scan.investigate("https://www.test.com")
+
+    assert actual == {"scan_uuid": submit_response["uuid"]}
+    mock_download_artifacts.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_investigate_records_trace(tmp_path, test_urlscan_params, submit_response, success_result_response,
+                                         not_found_result_response, screenshot_response, dom_response):
+    utils.create_data_dir(tmp_path)
+    tracer = tracing.Tracer()
+
+    with aioresponses() as mocked:
+        mocked.post(test_urlscan_params["submit_url"], status=200, body=json.dumps(submit_response))
+        mocked.get(test_urlscan_params["result_url"], status=404, body=json.dumps(not_found_result_response))
+        mocked.get(test_urlscan_params["result_url"], status=200, body=json.dumps(success_result_response))
+        mocked.get(test_urlscan_params["screenshot"]["link"], status=200, body=screenshot_response)
+        mocked.get(test_urlscan_params["dom"]["link"], status=200, body=dom_response)
+
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"], data_dir=tmp_path,
+                                   tracer=tracer) as url_scan:
+            url_scan.DEFAULT_PAUSE_TIME = 0
+            url_scan.scan_latency = 0
+            await url_scan.investigate("https://www.test.com")
+
+    spans = {span.name: span for span in tracer.finished_spans()}
+    assert {"investigate", "submit", "poll", "poll wait", "download", "POST scan", "GET result", "GET screenshots",
+            "GET doms", "rate limit wait"} <= set(spans)
+    assert not tracer.open
+    assert spans["poll"].parent is spans["investigate"]
+    assert spans["GET doms"].parent is spans["download"]
+    assert spans["GET result"].tags() == {
+        "url": "https://www.test.com", "scan_uuid": submit_response["uuid"], "http.request.method": "GET",
+        "url.full": test_urlscan_params["result_url"], "http.response.status_code": 200
+    }
+
+
+def test_next_poll_delay_backs_off_with_jitter():
+    url_scan = urlscan.UrlScan.__new__(urlscan.UrlScan)
+    delays = [url_scan.next_poll_delay(attempt) for attempt in range(10)]
+    assert delays[0] <= urlscan.UrlScan.DEFAULT_PAUSE_TIME * (1 + urlscan.UrlScan.POLL_JITTER)
+    assert max(delays) <= urlscan.UrlScan.MAX_PAUSE_TIME * (1 + urlscan.UrlScan.POLL_JITTER)
+    assert delays[-1] > delays[0]
+
+
+@pytest.mark.asyncio
+async def test_get_result_data_uses_cache(tmp_path, test_urlscan_params, success_result_response,
+                                          not_found_result_response):
+    result_cache = cache.ResultCache(tmp_path)
+    with aioresponses() as mocked:
+        mocked.get(test_urlscan_params["result_url"], status=404, body=json.dumps(not_found_result_response))
+        mocked.get(test_urlscan_params["result_url"], status=200, body=json.dumps(success_result_response))
+
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"],
+                                   result_cache=result_cache) as url_scan:
+            assert await url_scan.get_result_data(test_urlscan_params["uuid"]) == not_found_result_response
+            assert await url_scan.get_result_data(test_urlscan_params["uuid"]) == success_result_response
+            # No more responses are mocked, so this can only be served from the cache
+            assert await url_scan.get_result_data(test_urlscan_params["uuid"]) == success_result_response
+
+
+@pytest.mark.asyncio
+async def test_get_result_data_adds_results_to_report_store(tmp_path, test_urlscan_params, success_result_response,
+                                                            not_found_result_response):
+    report_store = reports.ReportStore(tmp_path.joinpath("reports.sqlite"))
+    with aioresponses() as mocked:
+        mocked.get(test_urlscan_params["result_url"], status=404, body=json.dumps(not_found_result_response))
+        mocked.get(test_urlscan_params["result_url"], status=200, body=json.dumps(success_result_response))
+
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"],
+                                   report_store=report_store) as url_scan:
+            await url_scan.get_result_data(test_urlscan_params["uuid"])
+            assert not report_store.contains(test_urlscan_params["uuid"])
+            await url_scan.get_result_data(test_urlscan_params["uuid"])
+
+    assert [result["uuid"] for result in report_store.search('urls:"google.com"')] == \
+           [str(test_urlscan_params["uuid"])]
+    report_store.close()
+
+
+@pytest.mark.asyncio
+async def test_submit_scan_request_reuses_recent_scan(test_urlscan_params):
+    search_response = {
+        "results": [{
+            "task": {
+                "uuid": str(test_urlscan_params["uuid"]),
+                "time": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+                "url": "https://www.test.com"
+            }
+        }]
+    }
+    with aioresponses() as mocked:
+        mocked.get(re.compile(r"https://urlscan\.io/api/v1/search/.*"), status=200, body=json.dumps(search_response))
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"],
+                                   reuse_max_age=600) as url_scan:
+            actual = await url_scan.submit_scan_request("https://www.test.com")
+            assert str(test_urlscan_params["uuid"]) == actual
+
+
+@pytest.mark.asyncio
+async def test_submit_scan_request_submits_when_no_recent_scan(tmp_path, test_urlscan_params, submit_response):
+    submission_index = cache.SubmissionIndex(tmp_path.joinpath("submissions.jsonl"))
+    with aioresponses() as mocked:
+        mocked.get(re.compile(r"https://urlscan\.io/api/v1/search/.*"), status=200, body='{"results": []}')
+        mocked.post(test_urlscan_params["submit_url"], status=200, body=json.dumps(submit_response))
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"],
+                                   reuse_max_age=600,
+                                   submission_index=submission_index) as url_scan:
+            actual = await url_scan.submit_scan_request("https://www.test.com")
+            assert submit_response["uuid"] == actual
+            # The second submission is answered from the local index, no request is mocked for it
+            assert submit_response["uuid"] == await url_scan.submit_scan_request("https://www.test.com")
+
+
+@pytest.mark.asyncio
+async def test_shared_session_is_not_closed(test_urlscan_params, success_result_response):
+    with aioresponses() as mocked:
+        mocked.get(test_urlscan_params["result_url"], status=200, body=json.dumps(success_result_response))
+        async with transport.create_session() as session:
+            async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                       data_dir=test_urlscan_params["data_dir"],
+                                       session=session) as url_scan:
+                await url_scan.get_result_data(test_urlscan_params["uuid"])
+            assert not session.closed
+
+            request = mocked.requests[("GET", URL(test_urlscan_params["result_url"]))][0]
+            assert request.kwargs["data"] is None
+
+
+def search_page(start, count, has_more):
+    return json.dumps({
+        "results": [{"_id": str(i), "sort": [i, str(i)]} for i in range(start, start + count)],
+        "has_more": has_more
+    })
+
+
+@pytest.mark.asyncio
+async def test_iter_search_follows_search_after(test_urlscan_params):
+    with aioresponses() as mocked:
+        mocked.get(re.compile(r"https://urlscan\.io/api/v1/search/\?q=.*&size=2$"), status=200,
+                   body=search_page(0, 2, True))
+        mocked.get(re.compile(r"https://urlscan\.io/api/v1/search/\?.*search_after=1,1.*"), status=200,
+                   body=search_page(2, 1, False))
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"]) as url_scan:
+            actual = [result["_id"] async for result in url_scan.iter_search("domain:test.com", size=2)]
+            assert actual == ["0", "1", "2"]
+
+
+@pytest.mark.asyncio
+async def test_iter_search_respects_limit(test_urlscan_params):
+    with aioresponses() as mocked:
+        mocked.get(re.compile(r"https://urlscan\.io/api/v1/search/.*"), status=200, body=search_page(0, 5, True))
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"]) as url_scan:
+            actual = [result["_id"] async for result in url_scan.iter_search("domain:test.com", limit=3)]
+            assert actual == ["0", "1", "2"]
+            assert len(mocked.requests) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("output_format", ["ndjson", "csv"])
+async def test_batch_retrieve(mocker, tmp_path, test_urlscan_params, success_result_response, output_format):
+    mock_download_artifacts = mocker.patch("src.urlscanio.urlscan.UrlScan.download_artifacts")
+    mock_download_artifacts.return_value = {"scan_uuid": str(test_urlscan_params["uuid"]), "report": "report"}
+    uuids_file = tmp_path.joinpath("uuids.txt")
+    uuids_file.write_text(f"{test_urlscan_params['uuid']}\n\nnot-a-uuid\n")
+    output_file = io.StringIO()
+
+    with aioresponses() as mocked:
+        mocked.get(test_urlscan_params["result_url"], status=200, body=json.dumps(success_result_response))
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"]) as url_scan:
+            await url_scan.batch_retrieve(str(uuids_file), output_file, output_format=output_format)
+
+    lines = output_file.getvalue().splitlines()
+    if output_format == "csv":
+        assert lines == ["scan_uuid,report,screenshot,dom,outcome", f"{test_urlscan_params['uuid']},report,,,success"]
+    else:
+        assert [json.loads(line) for line in lines] == [mock_download_artifacts.return_value]
+
+
+@pytest.mark.asyncio
+async def test_batch_get_report_writes_ndjson(tmp_path, test_urlscan_params, success_result_response):
+    uuids_file = tmp_path.joinpath("uuids.txt")
+    uuids_file.write_text(f"{test_urlscan_params['uuid']}\n")
+    output_file = io.StringIO()
+
+    with aioresponses() as mocked:
+        mocked.get(test_urlscan_params["result_url"], status=200, body=json.dumps(success_result_response))
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"]) as url_scan:
+            await url_scan.batch_retrieve(str(uuids_file), output_file, reports=True)
+
+    assert json.loads(output_file.getvalue()) == success_result_response
+
+
+@pytest.mark.asyncio
+async def test_batch_retrieve_records_trace_per_uuid(tmp_path, test_urlscan_params, success_result_response,
+                                                     screenshot_response, dom_response):
+    utils.create_data_dir(tmp_path)
+    uuids_file = tmp_path.joinpath("uuids.txt")
+    uuids_file.write_text(f"{test_urlscan_params['uuid']}\n")
+    tracer = tracing.Tracer()
+
+    with aioresponses() as mocked:
+        mocked.get(test_urlscan_params["result_url"], status=200, body=json.dumps(success_result_response))
+        mocked.get(test_urlscan_params["screenshot"]["link"], status=200, body=screenshot_response)
+        mocked.get(test_urlscan_params["dom"]["link"], status=200, body=dom_response)
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"], data_dir=tmp_path,
+                                   tracer=tracer) as url_scan:
+            await url_scan.batch_retrieve(str(uuids_file), io.StringIO())
+
+    spans = tracer.finished_spans()
+    roots = [span for span in spans if span.parent is None]
+    assert [span.name for span in roots] == ["retrieve"]
+    assert {span.name for span in spans} == {"retrieve", "rate limit wait", "GET result", "GET screenshots",
+                                             "GET doms"}
+    assert all(span.tags()["scan_uuid"] == str(test_urlscan_params["uuid"]) for span in spans)
+
+
+@pytest.mark.asyncio
+async def test_batch_get_report_extracts_records(tmp_path, test_urlscan_params, success_result_response):
+    uuids_file = tmp_path.joinpath("uuids.txt")
+    uuids_file.write_text(f"{test_urlscan_params['uuid']}\n")
+    output_file = io.StringIO()
+
+    with aioresponses() as mocked:
+        mocked.get(test_urlscan_params["result_url"], status=200, body=json.dumps(success_result_response))
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"]) as url_scan:
+            with extract.Extractor(tmp_path.joinpath("extract"), sections=["page", "domains"]) as extractor:
+                await url_scan.batch_retrieve(str(uuids_file), output_file, reports=True, extractor=extractor)
+
+    domains = success_result_response["lists"]["domains"]
+    assert json.loads(output_file.getvalue()) == {"scan_uuid": str(test_urlscan_params["uuid"]),
+                                                  "records": {"page": 1, "domains": len(domains)}}
+    lines = tmp_path.joinpath("extract", "domains.ndjson").read_text().splitlines()
+    assert [json.loads(line)["domain"] for line in lines] == domains
+
+
+@pytest.mark.asyncio
+async def test_download_dom_to_artifact_store(tmp_path, test_urlscan_params, dom_response):
+    artifact_store = store.ArtifactStore(tmp_path.joinpath("store"))
+
+    with aioresponses() as mocked:
+        mocked.get(test_urlscan_params["dom"]["link"], status=200, body=dom_response)
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=tmp_path,
+                                   artifact_store=artifact_store) as url_scan:
             actual = await url_scan.download_dom(test_urlscan_params["uuid"], test_urlscan_params["dom"]["link"])
-            assert str(test_urlscan_params["dom"]["path"]) == actual
-            mock_save_file.assert_called_once()
+
+    assert actual.endswith(".gz")
+    assert artifact_store.read(f"doms/{test_urlscan_params['uuid']}.txt") == dom_response.encode("utf-8")
+    artifact_store.close()
+
+
+@pytest.mark.asyncio
+async def test_download_skips_artifact_already_in_store(tmp_path, test_urlscan_params, dom_response):
+    artifact_store = store.ArtifactStore(tmp_path.joinpath("store"))
+
+    with aioresponses() as mocked:
+        mocked.get(test_urlscan_params["dom"]["link"], status=200, body=dom_response)
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=tmp_path,
+                                   artifact_store=artifact_store) as url_scan:
+            first = await url_scan.download_dom(test_urlscan_params["uuid"], test_urlscan_params["dom"]["link"])
+            second = await url_scan.download_dom(test_urlscan_params["uuid"], test_urlscan_params["dom"]["link"])
+
+    assert str(first) == str(second)
+    assert len(mocked.requests) == 1
+    artifact_store.close()
+
+
+@pytest.mark.asyncio
+async def test_execute_records_metrics(test_urlscan_params, submit_response):
+    with aioresponses() as mocked:
+        mocked.post(test_urlscan_params["submit_url"], status=200, body=json.dumps(submit_response),
+                    headers={"X-Rate-Limit-Limit": "60", "X-Rate-Limit-Remaining": "59"})
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"]) as url_scan:
+            await url_scan.submit_scan_request("https://www.test.com")
+
+    summary = url_scan.metrics.summary()
+    assert summary["status_codes"] == {"scan": {"200": 1}}
+    assert summary["rate_limit_remaining"] == {"scan": 59}
+
+
+UNLIMITED_RATES = {"scan": (1000, 100), "result": (1000, 100), "search": (1000, 100)}
+
+
+@pytest.mark.asyncio
+async def test_execute_retries_after_retry_after(mocker, test_urlscan_params, submit_response):
+    mock_sleep = mocker.patch("src.urlscanio.retry.asyncio.sleep")
+    with aioresponses() as mocked:
+        mocked.post(test_urlscan_params["submit_url"], status=429, body="{}", headers={"Retry-After": "7"})
+        mocked.post(test_urlscan_params["submit_url"], status=503, body="{}")
+        mocked.post(test_urlscan_params["submit_url"], status=200, body=json.dumps(submit_response))
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"],
+                                   rate_limiter=ratelimit.RateLimiter(UNLIMITED_RATES)) as url_scan:
+            actual = await url_scan.submit_scan_request("https://www.test.com")
+
+    assert submit_response["uuid"] == actual
+    assert mock_sleep.call_count == 2
+    assert mock_sleep.call_args_list[0].args == (7,)
+
+
+@pytest.mark.asyncio
+async def test_execute_deadline_leaves_out_rate_limit_wait(test_urlscan_params, submit_response):
+    exhausted = {"X-Rate-Limit-Limit": "600", "X-Rate-Limit-Remaining": "0", "X-Rate-Limit-Window": "minute",
+                 "X-Rate-Limit-Reset-After": "0.3"}
+    with aioresponses() as mocked:
+        mocked.post(test_urlscan_params["submit_url"], status=200, body=json.dumps(submit_response),
+                    headers=exhausted, repeat=True)
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"],
+                                   rate_limiter=ratelimit.RateLimiter(UNLIMITED_RATES),
+                                   retry_policy=retry.RetryPolicy(deadline=0.1)) as url_scan:
+            await url_scan.submit_scan_request("https://www.test.com")
+            assert url_scan.rate_limiter.headroom("scan") < 0
+            actual = await url_scan.submit_scan_request("https://www.test.com")
+
+    assert submit_response["uuid"] == actual
+
+
+@pytest.mark.asyncio
+async def test_execute_gives_up_after_max_attempts(mocker, test_urlscan_params):
+    mocker.patch("src.urlscanio.retry.asyncio.sleep")
+    with aioresponses() as mocked:
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"],
+                                   retry_policy=retry.RetryPolicy(max_attempts=2)) as url_scan:
+            with pytest.raises(aiohttp.ClientConnectionError):
+                await url_scan.get_result_data(test_urlscan_params["uuid"])
+    assert len(mocked.requests[("GET", URL(test_urlscan_params["result_url"]))]) == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_investigate_reports_failed_urls(mocker, tmp_path, test_urlscan_params):
+    urls_file = tmp_path.joinpath("urls.txt")
+    urls_file.write_text("https://www.broken.com\nhttps://www.working.com\n")
+    output_path = tmp_path.joinpath("urls.csv")
+
+    async def fake_investigate(url, *_):
+        if "broken" in url:
+            raise aiohttp.ClientConnectionError()
+        return {"scan_uuid": "some-uuid", "report": "report"}
+    mocker.patch("src.urlscanio.urlscan.UrlScan.investigate", side_effect=fake_investigate)
+
+    async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                               data_dir=test_urlscan_params["data_dir"]) as url_scan:
+        await url_scan.batch_investigate(str(urls_file), output_path=output_path)
+
+    rows = sorted(output_path.read_text().splitlines()[1:])
+    assert rows == ["https://www.broken.com,,,,failure", "https://www.working.com,report,,,success"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stage_workers", [None, (1, 2, 1)])
+async def test_batch_investigate_survives_html_error_pages(mocker, tmp_path, test_urlscan_params, stage_workers):
+    mocker.patch("src.urlscanio.retry.asyncio.sleep")
+    urls_file = tmp_path.joinpath("urls.txt")
+    urls_file.write_text("https://www.test1.com\nhttps://www.test2.com\n")
+    output_path = tmp_path.joinpath("urls.csv")
+
+    with aioresponses() as mocked:
+        mocked.post(test_urlscan_params["submit_url"], status=502, body="<html><body>Bad Gateway</body></html>",
+                    repeat=True)
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"],
+                                   rate_limiter=ratelimit.RateLimiter(UNLIMITED_RATES),
+                                   retry_policy=retry.RetryPolicy(max_attempts=2)) as url_scan:
+            await url_scan.batch_investigate(str(urls_file), output_path=output_path, stage_workers=stage_workers)
+
+    rows = sorted(output_path.read_text().splitlines()[1:])
+    assert rows == ["https://www.test1.com,,,,failure", "https://www.test2.com,,,,failure"]
+
+
+@pytest.mark.asyncio
+async def test_search_and_get_result_data_survive_html_error_pages(mocker, test_urlscan_params):
+    mocker.patch("src.urlscanio.retry.asyncio.sleep")
+    with aioresponses() as mocked:
+        mocked.get(re.compile(r"https://urlscan\.io/api/v1/search/.*"), status=503, body="<html></html>",
+                   repeat=True)
+        mocked.get(test_urlscan_params["result_url"], status=503, body="<html></html>", repeat=True)
+        async with urlscan.UrlScan(api_key=test_urlscan_params["api_key"],
+                                   data_dir=test_urlscan_params["data_dir"],
+                                   rate_limiter=ratelimit.RateLimiter(UNLIMITED_RATES),
+                                   retry_policy=retry.RetryPolicy(max_attempts=1)) as url_scan:
+            assert await url_scan.search("domain:test.com") == ""
+            assert await url_scan.get_result_data(test_urlscan_params["uuid"]) == {}
+
+
+@pytest.mark.asyncio
+async def test_execute_fails_over_to_another_key(mocker, test_urlscan_params, submit_response):
+    mocker.patch("src.urlscanio.retry.asyncio.sleep")
+    key_pool = keypool.KeyPool([keypool.ApiKey(key, ratelimit.RateLimiter(UNLIMITED_RATES))
+                                for key in ("revoked", "exhausted", "spare")])
+    with aioresponses() as mocked:
+        mocked.post(test_urlscan_params["submit_url"], status=401, body="{}")
+        mocked.post(test_urlscan_params["submit_url"], status=429, body="{}")
+        mocked.post(test_urlscan_params["submit_url"], status=200, body=json.dumps(submit_response))
+        async with urlscan.UrlScan(api_key=None, data_dir=test_urlscan_params["data_dir"],
+                                   key_pool=key_pool) as url_scan:
+            actual = await url_scan.submit_scan_request("https://www.test.com")
+        calls = mocked.requests[("POST", URL(test_urlscan_params["submit_url"]))]
+
+    assert submit_response["uuid"] == actual
+    assert [call.kwargs["headers"]["API-Key"] for call in calls] == ["revoked", "exhausted", "spare"]
+    assert key_pool.keys[0].revoked
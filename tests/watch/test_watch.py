@@ -0,0 +1,104 @@
+import asyncio
+import io
+import json
+import pathlib
+
+import pytest
+from aioresponses import aioresponses
+
+from ..context import journal, ratelimit, urlscan, utils, watch
+
+SAMPLE_RESPONSE_DIR = pathlib.Path("tests/sample_responses").absolute()
+TEST_URL = "https://www.test.com"
+TEST_UUID = "e2963e73-74e2-46d0-b9d4-db7db9d6b79d"
+SUBMIT_URL = "https://urlscan.io/api/v1/scan/"
+RESULT_URL = f"https://urlscan.io/api/v1/result/{TEST_UUID}"
+DOM_URL = f"https://urlscan.io/dom/{TEST_UUID}/"
+SCREENSHOT_URL = f"https://urlscan.io/screenshots/{TEST_UUID}.png"
+UNLIMITED_RATES = {"scan": (1000, 100), "result": (1000, 100), "search": (1000, 100)}
+
+
+def result_body(**page):
+    body = json.loads(SAMPLE_RESPONSE_DIR.joinpath("result_api.json").read_text())
+    body["page"].update(page)
+    return body
+
+
+def mock_scan(mocked, body, dom):
+    mocked.post(SUBMIT_URL, status=200, body=SAMPLE_RESPONSE_DIR.joinpath("submit_api.json").read_text())
+    mocked.get(RESULT_URL, status=200, body=json.dumps(body))
+    mocked.get(DOM_URL, status=200, body=dom)
+    mocked.get(SCREENSHOT_URL, status=200, body=b"png", repeat=True)
+
+
+def create_url_scan(data_dir):
+    url_scan = urlscan.UrlScan(api_key="some-api-key", data_dir=data_dir,
+                               rate_limiter=ratelimit.RateLimiter(UNLIMITED_RATES))
+    url_scan.DEFAULT_PAUSE_TIME = 0
+    url_scan.scan_latency = 0
+    return url_scan
+
+
+@pytest.mark.asyncio
+async def test_check_only_keeps_changed_scans(tmp_path):
+    utils.create_data_dir(tmp_path)
+    events = io.StringIO()
+
+    with aioresponses() as mocked, journal.Journal(tmp_path.joinpath("watch.jsonl")) as state:
+        async with create_url_scan(tmp_path) as url_scan:
+            watcher = watch.Watcher(url_scan, tmp_path.joinpath("watch.jsonl"), events)
+            mock_scan(mocked, result_body(), "<html>v1</html>")
+            first = await watcher.check(TEST_URL, state)
+            tmp_path.joinpath("doms", f"{TEST_UUID}.txt").unlink()
+
+            mock_scan(mocked, result_body(), "<html>v1</html>")
+            unchanged = await watcher.check(TEST_URL, state)
+            assert not tmp_path.joinpath("doms", f"{TEST_UUID}.txt").exists()
+
+            mock_scan(mocked, result_body(title="Defaced"), "<html>v2</html>")
+            changed = await watcher.check(TEST_URL, state)
+
+    assert first["event"] == watch.Watcher.NEW
+    assert unchanged is None
+    assert changed["event"] == watch.Watcher.CHANGED
+    assert set(changed["changes"]) == {"dom_sha256", "page.title"}
+    assert changed["changes"]["page.title"]["current"] == "Defaced"
+    assert tmp_path.joinpath("doms", f"{TEST_UUID}.txt").read_text() == "<html>v2</html>"
+    assert [json.loads(line)["event"] for line in events.getvalue().splitlines()] == ["new", "changed"]
+
+
+@pytest.mark.asyncio
+async def test_watch_resumes_previous_schedule(tmp_path):
+    state_path = tmp_path.joinpath("watch.jsonl")
+    watch_list = tmp_path.joinpath("watch.txt")
+    watch_list.write_text(f"{TEST_URL} 1h\nhttps://www.other.com 0.05\n")
+    with journal.Journal(state_path) as state:
+        state.record(TEST_URL, journal.Journal.CHECKED, scan_uuid=TEST_UUID, dom_sha256="", fields={},
+                     checked_at="2026-01-01T00:00:00+00:00")
+
+    checked = []
+
+    async def fake_check(url, _):
+        checked.append(url)
+
+    async with create_url_scan(tmp_path) as url_scan:
+        watcher = watch.Watcher(url_scan, state_path, io.StringIO())
+        watcher.check = fake_check
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(watcher.watch(str(watch_list), workers=2), 0.3)
+
+    # The first URL was last checked more than an hour ago, the second one was never checked and is due every 50ms
+    assert checked.count(TEST_URL) == 1
+    assert checked.count("https://www.other.com") >= 3
+
+
+@pytest.mark.asyncio
+async def test_read_watch_list_skips_invalid_lines(tmp_path):
+    watch_list = tmp_path.joinpath("watch.txt")
+    watch_list.write_text(f"{TEST_URL}\n\nnot a url\nhttps://www.other.com 30m\nhttps://www.third.com soon\n")
+
+    async with create_url_scan(tmp_path) as url_scan:
+        watcher = watch.Watcher(url_scan, tmp_path.joinpath("watch.jsonl"), interval=60)
+        targets = await watcher.read_watch_list(str(watch_list))
+
+    assert targets == {TEST_URL: 60, "https://www.other.com": 1800}